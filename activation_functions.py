@@ -10,7 +10,8 @@ def sigmoid(x):
     return 1.0 / (1.0 + np.exp(-x))
 
 def sigmoid_derivative(x):
-    return sigmoid(x) * (1.0 - sigmoid(x))
+    s = 1.0 / (1.0 + np.exp(-x)) # <-- self-contained, so numba can compile it (see backends.py)
+    return s * (1.0 - s)
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - -
 
@@ -33,8 +34,8 @@ sin_derivative = lambda x: np.cos(x)
 # - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 def softmax(x):
-    x -= np.max(x) # <-- helps with numerical stability apparently 
-    return (np.exp(x).T / np.sum(np.exp(x),axis=1)).T
+    x = np.exp(x - np.max(x, axis = 1, keepdims = True)) # <-- subtracting the row max keeps exp from overflowing
+    return x / np.sum(x, axis = 1, keepdims = True)
 
 def softmax_derivative(x):
     return softmax(x) * (1 - softmax(x))
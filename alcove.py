@@ -9,42 +9,40 @@ Attention Learning COVEring Map (Kruschke, 1992)
     - response <-- luce-choice rule (ie, softmax without exponentiation)
     - focusing <-- biases impact of diverse dimensions during reconstruction
     - fit <-- trains model on a number of epochs
+    - fit_iter <-- same training as fit, as a generator of per-trial (or per-block) learning records
+    - fit_subjects <-- trains many simulated subjects at once (leading subject axis), returns per-block accuracy
+    - build_presentation_orders <-- independent random presentation orders for each simulated subject
     - predict <-- gets class predictions
     - build_params <-- returns dictionary of weights
     - update_params <-- updates weights
+    - build_workspace <-- preallocated buffers for trial_step
+    - trial_step <-- one allocation-free training trial (forward, humble teacher & both updates, in place)
+    - build_covering_map <-- regular grid of hidden nodes covering the stimulus space
+    - sparse_trial_step <-- one training trial that only touches nodes with similarity >= similarity_floor
 
 --- Note ---
+    - fit(..., backend = 'numba') runs each trial through a compiled kernel (optional numba requirement, see backends.py)
+    - fit(..., similarity_floor = ...) is for covering maps (many more nodes than items): each trial finds its candidate
+      nodes through an unweighted kd-tree (distances.build_index; scipy), keeps the ones with exp(-c * d) >= similarity_floor,
+      and only computes / updates those, so trials cost O(active nodes); nodes below the floor are treated as inactive
     - really need to update backprop to be a lot cleaner than it is
 '''
 ## external requirements
 import numpy as np
 
-## minkowski pairwise distance function (https://en.wikipedia.org/wiki/Minkowski_distance)
-def pdist(a1, a2, r, **kwargs):
-    attention_weights = kwargs.get('attention_weights', np.ones([1,a1.shape[1]]) / a1.shape[1])
-
-    # format inputs & exemplars for (i think vectorized) pairwise distance calculations
-    a1_tiled = np.tile(a1, a2.shape[0]).reshape(a1.shape[0], a2.shape[0], a1.shape[1])
-    a2_tiled = np.repeat([a2], a1.shape[0], axis=0)
-
-    distances = np.power(
-        np.sum(
-            np.multiply(
-                attention_weights,
-                np.abs(a1_tiled - a2_tiled) ** r
-            ),
-            axis = 2,
-        ),
-        1/r
-    )
-
-    return distances
-
+## local requirements
+from distances import pdist # <-- minkowski pairwise distances (picks a kernel for r)
+import distances as distance_functions
+import choice_rules
+import backends
+import utils
 
 ## "forward pass"
-def forward(model, inputs, exemplars, c, r):
-
-    distances = pdist(inputs, exemplars, r, attention_weights = params['attention_weights'])
+def forward(params, inputs, exemplars, c, r, **kwargs):
+    '''
+    cache = None <-- (dict) difference cache from distances.build_difference_cache (for fits that only change attention)
+    '''
+    distances = pdist(inputs, exemplars, r, attention_weights = params['attention_weights'], cache = kwargs.get('cache', None))
 
     # exemplar layer activations
     hidden_activation = np.exp(
@@ -114,16 +112,9 @@ def loss_grad(params, inputs, exemplars, c, r, targets):
     }
 
 
-def response(params, inputs, exemplars, c, r, phi): # softmax
-    output_activation = forward(params, inputs, exemplars, c, r)[-1]
-    return np.divide(
-        np.exp(output_activation * phi),
-      #---------#
-        np.sum(
-            np.exp(output_activation * phi), 
-            axis=1, keepdims=True
-        )
-    )
+def response(params, inputs, exemplars, c, r, phi, **kwargs): # softmax
+    output_activation = forward(params, inputs, exemplars, c, r, **kwargs)[-1]
+    return choice_rules.softmax(output_activation, phi = phi, out = kwargs.get('out', None))
 
 
 def build_params(num_features, num_exemplars, num_categories):
@@ -145,29 +136,287 @@ def update_params(params, gradients, attention_lr, association_lr):
     return params
 
 
+## preallocated buffers for trial_step (reused on every trial)
+def build_workspace(num_features, num_exemplars, num_categories):
+    return {
+        'differences': np.empty([num_exemplars, num_features]), # <-- |exemplars - input|
+        'differences_r': np.empty([num_exemplars, num_features]), # <-- |exemplars - input| ** r
+        'hidden_activation': np.empty(num_exemplars),
+        'output_activation': np.empty(num_categories),
+        'targets': np.empty(num_categories), # <-- humble teacher values
+        'error': np.empty(num_categories),
+        'backprop': np.empty(num_exemplars),
+        'attention_gradients': np.empty(num_features),
+        'association_gradients': np.empty([num_exemplars, num_categories]),
+    }
+
+
+## one training trial on a single item, computed & applied in place (same updates as loss_grad + update_params)
+def trial_step(params, workspace, inputs, targets, exemplars, c, r, attention_lr, association_lr):
+    '''
+    params <-- (dict) float64 weights; updated in place
+    workspace <-- (dict) from build_workspace
+    inputs, targets <-- (1d arrays) a single item [num_features] & its teacher values [num_categories]
+    returns output activations [num_categories] (a workspace buffer, overwritten on the next trial)
+    '''
+    ws = workspace
+    attention_weights = params['attention_weights'].reshape(-1)
+    association_weights = params['association_weights']
+
+    ## forward
+    np.subtract(exemplars, inputs, out = ws['differences'])
+    np.abs(ws['differences'], out = ws['differences'])
+    np.power(ws['differences'], r, out = ws['differences_r'])
+
+    hidden_activation = np.matmul(ws['differences_r'], attention_weights, out = ws['hidden_activation'])
+    if r != 1: np.power(hidden_activation, 1/r, out = hidden_activation)
+    hidden_activation *= -c
+    np.exp(hidden_activation, out = hidden_activation)
+
+    output_activation = np.matmul(hidden_activation, association_weights, out = ws['output_activation'])
+
+    ## humble teacher --> error
+    np.multiply(output_activation, targets, out = ws['targets'])
+    np.maximum(ws['targets'], 1, out = ws['targets'])
+    ws['targets'] *= targets
+    error = np.subtract(ws['targets'], output_activation, out = ws['error'])
+
+    ## gradients (from the weights before this update)
+    backprop = np.matmul(association_weights, error, out = ws['backprop'])
+    backprop *= hidden_activation
+    backprop *= c
+    attention_gradients = np.matmul(backprop, ws['differences'], out = ws['attention_gradients']) # <-- (negated) attention gradients
+    association_gradients = np.multiply(hidden_activation[:, None], error[None, :], out = ws['association_gradients'])
+
+    ## updates
+    attention_gradients *= attention_lr
+    attention_weights -= attention_gradients
+    np.maximum(attention_weights, 0, out = attention_weights)
+
+    association_gradients *= association_lr
+    association_weights += association_gradients
+
+    return output_activation
+
+
+## regular grid of hidden nodes over the stimulus space (kruschke's covering map)
+def build_covering_map(low, high, nodes_per_dimension):
+    '''
+    low, high <-- (1d arrays) [num_features] corners of the stimulus space
+    nodes_per_dimension <-- (int) nodes along each dimension (num_nodes = nodes_per_dimension ** num_features)
+
+    returns nodes [num_nodes x num_features]; use them as the 'exemplars' (& num_exemplars = num_nodes in build_params)
+    '''
+    axes = [np.linspace(l, h, nodes_per_dimension) for l, h in zip(np.reshape(low, -1), np.reshape(high, -1))]
+    return np.stack([axis.reshape(-1) for axis in np.meshgrid(*axes, indexing = 'ij')], axis = 1)
+
+
+## one training trial on the nodes with exp(-c * d) >= similarity_floor (same updates as trial_step, restricted to those)
+def sparse_trial_step(params, index, inputs, targets, exemplars, c, r, attention_lr, association_lr, similarity_floor):
+    '''
+    index <-- (dict) unweighted node index from distances.build_index(exemplars, r, np.ones([1, num_features]))
+    inputs, targets <-- (1d arrays) a single item [num_features] & its teacher values [num_categories]
+    returns (output activations [num_categories], indices of the active nodes)
+    '''
+    attention_weights = params['attention_weights'].reshape(-1)
+    association_weights = params['association_weights']
+
+    ## sum_k a_k |x_k - y_k|^r >= min(a) * sum_k |x_k - y_k|^r, so every active node is within radius / min(a)^(1/r) unweighted
+    radius = -np.log(similarity_floor) / c
+    min_attention = np.min(attention_weights)
+    if min_attention > 0:
+        nodes = np.array(index['tree'].query_ball_point(inputs, radius / min_attention ** (1/r), p = r), dtype = int)
+    else:
+        nodes = np.arange(exemplars.shape[0]) # <-- an ignored dimension doesn't bound anything
+
+    ## forward (exact weighted distances on the candidates, then the floor)
+    differences = np.abs(exemplars[nodes] - inputs)
+    hidden_activation = np.exp((-c) * np.matmul(differences ** r, attention_weights) ** (1/r))
+    active = hidden_activation >= similarity_floor
+    nodes, differences, hidden_activation = nodes[active], differences[active], hidden_activation[active]
+
+    output_activation = np.matmul(hidden_activation, association_weights[nodes])
+
+    ## humble teacher --> error; gradients from the weights before this update
+    error = (output_activation * targets).clip(1) * targets - output_activation
+    backprop = c * np.matmul(association_weights[nodes], error) * hidden_activation
+
+    ## updates
+    attention_weights -= attention_lr * np.matmul(backprop, differences)
+    np.maximum(attention_weights, 0, out = attention_weights)
+    association_weights[nodes] += association_lr * hidden_activation[:, None] * error[None, :]
+
+    return output_activation, nodes
+
+
+def fit(params, inputs, exemplars, targets, c, r, attention_lr, association_lr, training_epochs = 1, randomize_presentation = True, backend = 'numpy', similarity_floor = None, index = None, criterion = None):
+    '''
+    backend = 'numpy' <-- (str) 'numba' (or 'auto') runs each trial as one compiled kernel (see backends.py)
+    similarity_floor = None <-- (numeric) only compute / update nodes with exp(-c * d) >= similarity_floor (see sparse_trial_step; backend is ignored)
+    index = None <-- (dict) unweighted node index for similarity_floor (built here if not given)
+    criterion = None <-- (dict) {'accuracy': threshold} or {'loss': threshold}; stops after the first block (epoch) that meets it
+        & returns (params, stopping trial) instead (stopping trial is None if training_epochs ran out first)
+    '''
+    if criterion is not None:
+        correct = np.argmax(targets, axis = 1)
+        stopping_trial = utils.run_to_criterion(
+            fit_iter(params, inputs, exemplars, targets, c, r, attention_lr, association_lr, training_epochs = training_epochs,
+                     randomize_presentation = randomize_presentation, backend = backend, similarity_floor = similarity_floor, index = index),
+            lambda record: correct[record['item']], criterion, inputs.shape[0]
+        )
+        return params, stopping_trial
+
+    for _ in trials(params, inputs, exemplars, targets, c, r, attention_lr, association_lr, training_epochs, randomize_presentation, backend, similarity_floor, index):
+        pass
+
+    return params
+
+
+## learning trajectory: trains like fit, yielding a lightweight record per trial (or per block) along the way
+def fit_iter(params, inputs, exemplars, targets, c, r, attention_lr, association_lr, phi = 1, training_epochs = 1, randomize_presentation = True, backend = 'numpy', per = 'trial', similarity_floor = None, index = None):
+    '''
+    phi = 1 <-- (numeric) response mapping parameter for the recorded probabilities
+    per = 'trial' <-- (str) 'trial' or 'block' (one record per epoch)
+    similarity_floor = None, index = None <-- (see fit)
 
-def fit(params, inputs, exemplars, targets, c, r, attention_lr, association_lr, training_epochs = 1, randomize_presentation = True):
+    yields dictionaries with 'epoch', 'trial', 'item', 'probabilities' (response before the update) & 'loss'
+        (per block: 'items', 'probabilities' [num_trials x num_categories] & mean 'loss'); params are updated in place
+    '''
+    block = []
+    for epoch, trial, item, output_activation in trials(params, inputs, exemplars, targets, c, r, attention_lr, association_lr, training_epochs, randomize_presentation, backend, similarity_floor, index):
+        teacher = (output_activation * targets[item]).clip(1) * targets[item] # <-- humble teacher values
+        record = {
+            'epoch': epoch,
+            'trial': trial,
+            'item': item,
+            'probabilities': choice_rules.softmax(output_activation[None, :], phi = phi)[0],
+            'loss': .5 * np.sum(np.square(teacher - output_activation)),
+        }
+
+        if per == 'trial':
+            yield record
+            continue
+
+        block.append(record)
+        if len(block) == inputs.shape[0]:
+            yield {
+                'epoch': epoch,
+                'items': np.array([record['item'] for record in block]),
+                'probabilities': np.array([record['probabilities'] for record in block]),
+                'loss': np.mean([record['loss'] for record in block]),
+            }
+            block = []
+
+
+## runs the training trials, yielding (epoch, trial, item, output activations from before the update) for each
+def trials(params, inputs, exemplars, targets, c, r, attention_lr, association_lr, training_epochs = 1, randomize_presentation = True, backend = 'numpy', similarity_floor = None, index = None):
     presentation_order = np.arange(inputs.shape[0])
+    backend = 'sparse' if similarity_floor is not None else backends.resolve(backend)
+
+    # both backends update these in place, so they need to be contiguous float64
+    params['attention_weights'] = np.ascontiguousarray(params['attention_weights'], dtype = np.float64)
+    params['association_weights'] = np.ascontiguousarray(params['association_weights'], dtype = np.float64)
+    inputs, exemplars, targets = [np.ascontiguousarray(a, dtype = np.float64) for a in [inputs, exemplars, targets]]
+    workspace = build_workspace(inputs.shape[1], exemplars.shape[0], targets.shape[1]) if backend == 'numpy' else None
+    if backend == 'sparse' and index is None:
+        index = distance_functions.build_index(exemplars, r, np.ones([1, exemplars.shape[1]]))
 
+    trial = 0
     for e in range(training_epochs):
         if randomize_presentation == True: np.random.shuffle(presentation_order)
 
         for i in presentation_order:        
 
-            params = update_params(
-                params, 
-                loss_grad(params, inputs[i:i+1,:], exemplars, c, r, targets[i:i+1,:]), # <-- returns gradients
-                attention_lr,
-                association_lr,
-            )
+            if backend == 'sparse':
+                output_activation = sparse_trial_step(params, index, inputs[i], targets[i], exemplars, c, r, attention_lr, association_lr, similarity_floor)[0]
+            elif backend == 'numba':
+                output_activation = backends.alcove_trial(
+                    params['attention_weights'].reshape(-1), params['association_weights'],
+                    inputs[i], targets[i], exemplars, c, r, attention_lr, association_lr,
+                )
+            else:
+                output_activation = trial_step(params, workspace, inputs[i], targets[i], exemplars, c, r, attention_lr, association_lr)
 
-    return params
+            yield e, trial, i, output_activation
+            trial += 1
+
+
+## random order of all items within each block, independently for every simulated subject
+def build_presentation_orders(num_subjects, num_items, num_blocks):
+    return np.argsort(
+        np.random.uniform(0, 1, [num_subjects, num_blocks, num_items]),
+        axis = 2
+    ).reshape(num_subjects, num_blocks * num_items)
+
+
+## trains many simulated subjects in lockstep (every weight carries a leading subject axis)
+def fit_subjects(params, inputs, exemplars, targets, c, r, attention_lr, association_lr, presentation_orders, phi = 1, block_size = None):
+    '''
+    params <-- (dict) from build_params; every subject starts from a copy
+    presentation_orders <-- (2d int array) [num_subjects x num_trials] item shown to each subject on each trial
+    phi = 1 <-- (numeric) response mapping parameter used for the accuracy curve
+    block_size = num_items <-- (int) trials per block of the accuracy curve
+
+    returns (params, accuracy):
+        params <-- 'attention_weights' [num_subjects x 1 x num_features], 'association_weights' [num_subjects x num_exemplars x num_categories]
+        accuracy <-- [num_subjects x num_blocks] mean probability of the correct category (responses made before each update)
+    '''
+    presentation_orders = np.asarray(presentation_orders, dtype = int)
+    num_subjects, num_trials = presentation_orders.shape
+    if block_size is None: block_size = inputs.shape[0]
+    subjects = np.arange(num_subjects)
+
+    attention_weights = np.repeat(np.asarray(params['attention_weights'], dtype = np.float64).reshape(1, 1, -1), num_subjects, axis = 0)
+    association_weights = np.repeat(np.asarray(params['association_weights'], dtype = np.float64)[None], num_subjects, axis = 0)
+
+    # per item |exemplar - input| (and its r-th power), computed once for the whole run [num_items x num_exemplars x num_features]
+    item_differences = np.abs(exemplars[None, :, :] - inputs[:, None, :]).astype(np.float64)
+    item_differences_r = item_differences ** r
+    correct_category = np.argmax(targets, axis = 1)
+
+    num_blocks = -(-num_trials // block_size)
+    accuracy = np.zeros([num_subjects, num_blocks])
+
+    for t in range(num_trials):
+        items = presentation_orders[:, t]
+        differences = item_differences[items]
+        trial_targets = targets[items]
+
+        ## forward [subjects x exemplars] --> [subjects x categories]
+        hidden_activation = np.exp(
+            (-c) * np.einsum('sed,sd->se', item_differences_r[items], attention_weights[:, 0, :]) ** (1/r)
+        )
+        output_activation = np.einsum('se,sek->sk', hidden_activation, association_weights)
+
+        accuracy[:, t // block_size] += choice_rules.softmax(output_activation, phi = phi)[subjects, correct_category[items]]
+
+        ## humble teacher & gradients (same as loss_grad, one row per subject)
+        error = (output_activation * trial_targets).clip(1) * trial_targets - output_activation
+
+        attention_gradients = -np.einsum(
+            'se,sed->sd',
+            c * np.einsum('sek,sk->se', association_weights, error) * hidden_activation,
+            differences
+        )
+
+        ## updates
+        attention_weights += attention_lr * attention_gradients[:, None, :]
+        attention_weights *= attention_weights > 0
+        association_weights += association_lr * error[:, None, :] * hidden_activation[:, :, None]
+
+    accuracy /= np.minimum(block_size, num_trials - np.arange(num_blocks) * block_size) # <-- last block may be short
+
+    return {
+        **params,
+        'attention_weights': attention_weights,
+        'association_weights': association_weights,
+    }, accuracy
 
 
 ## predict
-def predict(params, inputs, exemplars, c, r):
+def predict(params, inputs, exemplars, c, r, **kwargs):
     return np.argmax(
-        response(params, inputs, exemplars, c, r, 1),
+        response(params, inputs, exemplars, c, r, 1, **kwargs),
         axis = 1
     )
 
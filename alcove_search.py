@@ -0,0 +1,268 @@
+'''
+ALCOVE Hyperparameter Search (learning curves)
+- - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+--- Functions ---
+    - grid_candidates <-- every combination of the listed values (lazily)
+    - random_candidates <-- uniform (or log-uniform) draws within bounds
+    - evaluate <-- simulated learning curves for one candidate & their fit (SSE / binomial nll) to the observed curves
+    - search <-- evaluates candidates over a process pool, yielding results as they finish
+    - differential_evolution <-- DE/rand/1/bin over the same pool, yielding every evaluated candidate
+
+--- Notes ---
+    - candidates are dictionaries with 'c', 'phi', 'attention_lr' & 'association_lr' (r is held fixed)
+    - inputs, targets [num_problems x num_items x num_categories], observed curves [num_problems x num_blocks] & the
+      presentation orders are put in shared memory once; workers attach to them instead of unpickling them per task
+    - every candidate is simulated with the same presentation orders (common random numbers), so differences in fit
+      come from the hyperparameters rather than from the simulated subjects
+    - curves are the mean probability of the correct category per block (alcove.fit_subjects accuracy, i.e. the softmax
+      response probability, averaged over trials & simulated subjects), not the proportion of argmax-correct trials; supply
+      observed proportion correct per block, which is what that probability predicts (& what the binomial nll treats as
+      the observed success rate out of num_responses)
+    - workers = 0 runs everything in this process (handy for debugging)
+'''
+## external requirements
+import itertools
+import contextlib
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+
+## local requirements
+import alcove
+
+
+## - - - - - - - - - - - - - - - - - -
+## candidates
+## - - - - - - - - - - - - - - - - - -
+
+## every combination of the listed values, e.g. {'c': [1, 2], 'phi': [1, 2, 4], ...}
+def grid_candidates(space):
+    names = list(space)
+    for values in itertools.product(*[space[name] for name in names]):
+        yield dict(zip(names, values))
+
+
+## num_candidates draws within (low, high) bounds, e.g. {'c': (.1, 10), ...}
+def random_candidates(bounds, num_candidates, log_scale = ()):
+    '''
+    log_scale = () <-- (iterable) names drawn log-uniformly (e.g. c & phi, which span orders of magnitude)
+    '''
+    for _ in range(num_candidates):
+        yield {
+            name: np.exp(np.random.uniform(np.log(low), np.log(high))) if name in log_scale else np.random.uniform(low, high)
+            for name, (low, high) in bounds.items()
+        }
+
+
+## - - - - - - - - - - - - - - - - - -
+## shared data
+## - - - - - - - - - - - - - - - - - -
+
+# arrays & settings the evaluations read from (set in each worker by attach)
+shared = {}
+shared_blocks = [] # <-- keeps the attached shared memory open in the workers
+
+
+## copies arrays into new shared memory blocks; returns (blocks, specs) where specs are (name, shape, dtype) for attach
+def share_arrays(arrays):
+    blocks, specs = [], {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create = True, size = max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype = array.dtype, buffer = block.buf)[...] = array
+        blocks.append(block)
+        specs[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, specs
+
+
+## pool initializer: read-only views of the shared arrays
+def attach(specs, settings):
+    shared.clear()
+    for name, (block_name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name = block_name)
+        shared_blocks.append(block)
+        shared[name] = np.ndarray(shape, dtype = dtype, buffer = block.buf)
+        shared[name].flags.writeable = False
+    shared.update(settings)
+
+
+## shares the data & starts the pool (or just sets the data up in this process when workers = 0)
+@contextlib.contextmanager
+def evaluation_pool(inputs, targets, curves, presentation_orders, r, num_responses, workers):
+    arrays = {
+        'inputs': np.asarray(inputs, dtype = np.float64),
+        'targets': np.asarray(targets, dtype = np.float64),
+        'curves': np.asarray(curves, dtype = np.float64),
+        'presentation_orders': np.asarray(presentation_orders, dtype = int),
+    }
+    settings = {'r': r, 'num_responses': num_responses}
+
+    if workers == 0:
+        shared.clear()
+        shared.update(arrays)
+        shared.update(settings)
+        yield None
+        return
+
+    blocks, specs = share_arrays(arrays)
+    try:
+        with multiprocessing.Pool(workers, initializer = attach, initargs = (specs, settings)) as pool:
+            yield pool
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+## - - - - - - - - - - - - - - - - - -
+## evaluation
+## - - - - - - - - - - - - - - - - - -
+
+## simulated curves for one candidate (reads the shared data) & their fit to the observed curves
+def evaluate(candidate):
+    '''
+    returns dictionary with the 'candidate', simulated 'curves' [num_problems x num_blocks], 'sse' &
+        'nll' (binomial, when num_responses observed responses per block were given; otherwise None)
+    '''
+    inputs, targets, curves = shared['inputs'], shared['targets'], shared['curves']
+    params = alcove.build_params(inputs.shape[1], inputs.shape[0], targets.shape[2])
+
+    predicted = np.array([
+        alcove.fit_subjects(
+            params, inputs, inputs, problem_targets,
+            candidate['c'], shared['r'], candidate['attention_lr'], candidate['association_lr'],
+            shared['presentation_orders'], phi = candidate['phi'],
+        )[1].mean(axis = 0)
+        for problem_targets in targets
+    ])
+
+    nll = None
+    if shared['num_responses'] is not None:
+        p = np.clip(predicted, 1e-12, 1 - 1e-12)
+        nll = -shared['num_responses'] * np.sum(curves * np.log(p) + (1 - curves) * np.log(1 - p))
+
+    return {
+        'candidate': candidate,
+        'curves': predicted,
+        'sse': np.sum(np.square(predicted - curves)),
+        'nll': nll,
+    }
+
+
+## index & result, so results streamed back out of order can be matched to their candidates
+def evaluate_indexed(indexed_candidate):
+    index, candidate = indexed_candidate
+    return {'index': index, **evaluate(candidate)}
+
+
+## evaluates candidates over a process pool, yielding results in the order they finish
+def search(candidates, inputs, targets, curves, presentation_orders, r = 1, num_responses = None, workers = None, chunksize = 1):
+    '''
+    candidates <-- (iterable) dictionaries from grid_candidates / random_candidates (or any others)
+    inputs <-- (2d array) stimuli [num_items x num_features] (also used as the exemplars)
+    targets <-- (3d array) +1/-1 teacher values for each problem [num_problems x num_items x num_categories]
+    curves <-- (2d array) observed proportion correct [num_problems x num_blocks] (compared with the simulated mean probability correct)
+    presentation_orders <-- (2d int array) from alcove.build_presentation_orders(num_subjects, num_items, num_blocks)
+    num_responses = None <-- (int) observed responses behind each curve point; enables the binomial 'nll'
+    workers = None <-- (int) pool size (None: all cores, 0: run in this process)
+
+    yields dictionaries from evaluate, plus the candidate's 'index'
+    '''
+    with evaluation_pool(inputs, targets, curves, presentation_orders, r, num_responses, workers) as pool:
+        tasks = enumerate(candidates)
+        results = map(evaluate_indexed, tasks) if pool is None else pool.imap_unordered(evaluate_indexed, tasks, chunksize)
+        for result in results:
+            yield result
+
+
+## differential evolution (DE/rand/1/bin), one pooled generation at a time
+def differential_evolution(bounds, inputs, targets, curves, presentation_orders, r = 1, num_responses = None, workers = None,
+                           population_size = 20, generations = 50, mutation = .8, crossover = .9, objective = 'sse'):
+    '''
+    bounds <-- (dict) (low, high) for each hyperparameter; candidates are clipped to them
+    objective = 'sse' <-- (str) 'sse' or 'nll' (which needs num_responses)
+    (the data arguments are the same as search's)
+
+    yields every evaluated candidate (dictionaries from evaluate, plus its 'generation'); the last population's best
+        is the lowest objective seen
+    '''
+    names = list(bounds)
+    low, high = np.array([bounds[name] for name in names], dtype = np.float64).T
+    unpack = lambda vector: dict(zip(names, vector.tolist()))
+
+    with evaluation_pool(inputs, targets, curves, presentation_orders, r, num_responses, workers) as pool:
+        pool_map = map if pool is None else pool.map
+
+        population = np.random.uniform(low, high, [population_size, len(names)])
+        scores = []
+        for result in pool_map(evaluate, [unpack(vector) for vector in population]):
+            scores.append(result[objective])
+            yield {'generation': 0, **result}
+        scores = np.array(scores)
+
+        for generation in range(1, generations + 1):
+            ## mutation: a + F (b - c) from three distinct others
+            others = np.array([
+                np.random.choice(np.delete(np.arange(population_size), i), 3, replace = False)
+                for i in range(population_size)
+            ])
+            mutants = population[others[:, 0]] + mutation * (population[others[:, 1]] - population[others[:, 2]])
+            mutants = np.clip(mutants, low, high)
+
+            ## binomial crossover (at least one coordinate always comes from the mutant)
+            cross = np.random.uniform(0, 1, population.shape) < crossover
+            cross[np.arange(population_size), np.random.randint(len(names), size = population_size)] = True
+            trials = np.where(cross, mutants, population)
+
+            ## selection
+            for i, result in enumerate(pool_map(evaluate, [unpack(vector) for vector in trials])):
+                if result[objective] <= scores[i]:
+                    population[i], scores[i] = trials[i], result[objective]
+                yield {'generation': generation, **result}
+
+
+## - - - - - - - - - - - - - - - - - -
+## RUN MODEL
+## - - - - - - - - - - - - - - - - - -
+if __name__ == '__main__':
+    np.random.seed(0)
+
+    inputs = np.array([
+        [1, 1, 1],
+        [1, 1, 0],
+        [1, 0, 1],
+        [1, 0, 0],
+
+        [0, 0, 0],
+        [0, 0, 1],
+        [0, 1, 0],
+        [0, 1, 1],
+    ])
+
+    problems = [
+        ['A','A','A','A', 'B','B','B','B'], # <-- type 1
+        ['A','A','B','B', 'B','B','A','A'], # <-- type 2
+        ['A','A','A','B', 'B','B','B','A'], # <-- type 4
+        ['B','A','A','B', 'A','B','B','A'], # <-- type 6
+    ]
+    targets = np.array([np.eye(2)[[0 if label == 'A' else 1 for label in labels]] * 2 - 1 for labels in problems])
+
+    num_subjects, num_blocks = 50, 16
+    presentation_orders = alcove.build_presentation_orders(num_subjects, inputs.shape[0], num_blocks)
+
+    ## stand-in for human learning curves: curves simulated from known hyperparameters
+    true_candidate = {'c': 6.5, 'phi': 2., 'attention_lr': .03, 'association_lr': .03}
+    with evaluation_pool(inputs, targets, np.zeros([len(problems), num_blocks]), presentation_orders, 1, None, 0):
+        curves = evaluate(true_candidate)['curves']
+
+    space = {'c': [2, 6.5], 'phi': [1, 2, 4], 'attention_lr': [.01, .03], 'association_lr': [.01, .03]}
+    best = min(search(grid_candidates(space), inputs, targets, curves, presentation_orders, workers = 4), key = lambda result: result['sse'])
+    print('grid best:', best['candidate'], '| sse: {:.5f}'.format(best['sse']))
+
+    bounds = {'c': (.5, 10), 'phi': (.5, 5), 'attention_lr': (.001, .1), 'association_lr': (.001, .1)}
+    best = min(
+        differential_evolution(bounds, inputs, targets, curves, presentation_orders, workers = 4, population_size = 12, generations = 5),
+        key = lambda result: result['sse']
+    )
+    print('DE best:', {name: round(value, 3) for name, value in best['candidate'].items()}, '| sse: {:.5f}'.format(best['sse']))
@@ -4,6 +4,7 @@ Autoencoder
 
 --- Functions ---
     - forward <-- get model outputs
+    - encode <-- hidden representations only (no decoder), optionally chunked & cached
     - loss <-- cost function
     - loss_grad <-- returns gradients
     - fit <-- trains model on a number of epochs
@@ -13,12 +14,22 @@ Autoencoder
 
 --- Notes ---
     - implements sum-squared-error cost function
+    - params carry a 'version' counter that every update bumps; encode(..., cache = {}) reuses its last result while the
+      params (same object & version), the hidden activation & the inputs (utils.fingerprint) are unchanged, so repeated
+      queries between updates are free
+      (bump params['version'] yourself after editing weights by hand)
+    - fit(..., backend = 'numba') runs each trial through a compiled kernel (optional numba requirement, see backends.py)
     - hidden activation function & derivative have to be provided in 'hps' dictionary (there are some available in the utils.py script)
 '''
 
 ## external requirements
 import numpy as np
 
+## local requirements
+import backends
+import precision
+import utils
+
 
 ## "forward pass"
 def forward(params, inputs, hps):
@@ -45,6 +56,43 @@ def forward(params, inputs, hps):
     return [hidden_act_raw, hidden_act, output_act_raw, output_act]
 
 
+## hidden representations (stops at the hidden layer)
+def encode(params, inputs, hps, chunk_size = None, cache = None):
+    '''
+    chunk_size = None <-- (int) items encoded at a time; all at once by default
+    cache = None <-- (dict) reused across calls; holds the last result, keyed by these params (the object itself, kept
+        in the cache), their version, the hidden activation function & the inputs
+
+    returns hidden activations [num_items x num_hidden_nodes]
+    '''
+    inputs = precision.cast(inputs)
+
+    if cache is not None:
+        key = (params.get('version', 0), hps['hidden_activation'], utils.fingerprint(inputs))
+        if cache.get('params', None) is params and cache.get('key', None) == key: return cache['hidden_activation']
+
+    if chunk_size is None: chunk_size = inputs.shape[0]
+    hidden_activation = np.empty(
+        [inputs.shape[0], params['input']['hidden']['weights'].shape[1]],
+        dtype = np.result_type(inputs, params['input']['hidden']['weights'])
+    )
+    for start in range(0, inputs.shape[0], chunk_size):
+        chunk = slice(start, start + chunk_size)
+        hidden_activation[chunk] = hps['hidden_activation'](
+            np.add(
+                np.matmul(
+                    inputs[chunk],
+                    params['input']['hidden']['weights']
+                ),
+                params['input']['hidden']['bias']
+            )
+        )
+
+    if cache is not None:
+        cache['params'], cache['key'], cache['hidden_activation'] = params, key, hidden_activation
+    return hidden_activation
+
+
 ## cost function (sum squared error)
 def loss(params, inputs, hps, targets = None):
     if np.any(targets) == None: targets = inputs
@@ -135,7 +183,7 @@ def build_params(num_features, num_hidden_nodes, weight_range = [-.1, .1]):
     num_hidden_nodes <-- (numeric)
     weight_range = [-.1,.1] <-- (list of numeric)
     '''
-    return {
+    return precision.cast_params({
         'input': {
             'hidden': {
                 'weights': np.random.uniform(*weight_range, [num_features, num_hidden_nodes]),
@@ -147,8 +195,9 @@ def build_params(num_features, num_hidden_nodes, weight_range = [-.1, .1]):
                 'weights': np.random.uniform(*weight_range, [num_hidden_nodes, num_features]),
                 'bias': np.random.uniform(*weight_range, [1, num_features]),
             }
-        }
-    }
+        },
+        'version': 0, # <-- bumped on every update (see encode)
+    })
 
 def build_params_xavier(num_features, num_hidden_nodes):
     '''
@@ -156,7 +205,7 @@ def build_params_xavier(num_features, num_hidden_nodes):
     num_hidden_nodes <-- (numeric)
     weight_range = [-.1,.1] <-- (list of numeric)
     '''
-    return {
+    return precision.cast_params({
         'input': {
             'hidden': {
                 'weights': np.random.normal(0, 1, [num_features, num_hidden_nodes]) * np.sqrt(2 / (num_features + num_hidden_nodes)),
@@ -168,28 +217,45 @@ def build_params_xavier(num_features, num_hidden_nodes):
                 'weights': np.random.normal(0, 1, [num_hidden_nodes, num_features]) * np.sqrt(2 / (num_hidden_nodes + num_features)),
                 'bias': np.zeros([1, num_features]),
             }
-        }
-    }
+        },
+        'version': 0, # <-- bumped on every update (see encode)
+    })
 
 ## weight update
 def update_params(params, gradients, lr):
-    for layer in params:
+    for layer in gradients:
         for connection in gradients[layer]:
             params[layer][connection]['weights'] -= lr * gradients[layer][connection]['weights']
             params[layer][connection]['bias'] -= lr * gradients[layer][connection]['bias']
+    params['version'] = params.get('version', 0) + 1
     return params
 
 
 ## fit to training set
-def fit(params, inputs, hps, targets = None, training_epochs = 1, randomize_presentation = True):
+def fit(params, inputs, hps, targets = None, training_epochs = 1, randomize_presentation = True, backend = 'numpy'):
+    '''
+    backend = 'numpy' <-- (str) 'numba' (or 'auto') runs each trial as one compiled kernel (see backends.py)
+    '''
     if np.any(targets) == None: targets = inputs
+    inputs, targets = precision.cast(inputs), precision.cast(targets)
     presentation_order = np.arange(inputs.shape[0])
 
+    activations = backends.network_activations(hps, backend)
+
     for e in range(training_epochs):
         if randomize_presentation == True: np.random.shuffle(presentation_order)
         
         for i in range(inputs.shape[0]):
 
+            if activations is not None:
+                backends.network_trial(
+                    params['input']['hidden']['weights'], params['input']['hidden']['bias'],
+                    params['hidden']['output']['weights'], params['hidden']['output']['bias'],
+                    inputs[i:i+1,:], targets[i:i+1,:], hps['learning_rate'], *activations
+                )
+                params['version'] = params.get('version', 0) + 1
+                continue
+
             params = update_params(
                 params, 
                 loss_grad(params, inputs[i:i+1,:], hps, targets = targets[i:i+1,:]), # <-- returns gradients
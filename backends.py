@@ -0,0 +1,169 @@
+'''
+_ _ _ Compute Backends _ _ _
+- - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+--- Functions ---
+    - resolve <-- maps 'auto' / 'numpy' / 'numba' to the backend that will actually run
+    - jit <-- compiles a function with numba (when installed), otherwise returns it unchanged
+    - minkowski_kernel <-- attention weighted minkowski distances, one (input, exemplar) pair at a time
+    - alcove_trial <-- fused single-trial ALCOVE forward / backward / update (in place)
+    - network_trial <-- fused single-trial forward / backward / update for one encoder-decoder pair (in place)
+
+--- Notes ---
+    - numba is an optional requirement; 'auto' uses it when it can be imported and falls back to numpy otherwise
+    - the kernels are plain loops / np.dot calls, so they also run (slowly) as ordinary python
+    - compiled kernels reorder some floating point sums, so trajectories match the numpy backend to rounding error (~1e-15)
+    - activation functions handed to network_trial must be numba-compilable (self-contained numpy lambdas & the ones in
+      activation_functions.py are); models fall back to the numpy backend with a warning when they aren't
+'''
+## external requirements
+import warnings
+import numpy as np
+
+try:
+    import numba # <-- optional requirement
+except ImportError:
+    numba = None
+
+
+## 'auto' --> 'numba' if it is installed, else 'numpy'
+def resolve(backend = 'auto'):
+    if backend == 'auto':
+        return 'numpy' if numba is None else 'numba'
+    if backend == 'numba' and numba is None:
+        raise ImportError("backend 'numba' requested but numba is not installed")
+    if backend not in ['numpy', 'numba']:
+        raise ValueError('unknown backend: ' + str(backend))
+    return backend
+
+
+## compile with numba (lazily, on first call) when it is available
+def jit(func):
+    if numba is None: return func
+    return numba.njit(func)
+
+
+## compiled versions of the hps activation functions, or None for ones numba can't compile (e.g., lambdas calling plain python globals)
+compiled_activations = {}
+def jit_activation(func):
+    if func not in compiled_activations:
+        try:
+            compiled = func if isinstance(func, numba.core.registry.CPUDispatcher) else numba.njit(func)
+            compiled(np.zeros([1, 1])) # <-- compile now, so failures show up here instead of mid-training
+            compiled_activations[func] = compiled
+        except Exception:
+            compiled_activations[func] = None
+    return compiled_activations[func]
+
+
+## compiled (activation, derivative, ...) tuple for network_trial, or None if any of them can't be compiled
+def jit_activations(hps):
+    compiled = tuple(
+        jit_activation(hps[name])
+        for name in ['hidden_activation', 'hidden_activation_deriv', 'output_activation', 'output_activation_deriv']
+    )
+    return None if any(func is None for func in compiled) else compiled
+
+
+## compiled activations for a network model's fit, or None when it should run the numpy code
+def network_activations(hps, backend):
+    if resolve(backend) == 'numpy': return None
+
+    compiled = jit_activations(hps)
+    if compiled is None:
+        warnings.warn("numba can't compile the hps activation functions (do they call plain python functions?); using the numpy backend")
+    return compiled
+
+
+## - - - - - - - - - - - - - - - - - -
+## kernels
+## - - - - - - - - - - - - - - - - - -
+
+@jit
+def minkowski_kernel(a1, a2, r, attention_weights, out):
+    for i in range(a1.shape[0]):
+        for j in range(a2.shape[0]):
+            total = 0.0
+            for d in range(a1.shape[1]):
+                total += attention_weights[d] * np.abs(a1[i, d] - a2[j, d]) ** r
+            out[i, j] = total ** (1 / r)
+    return out
+
+
+@jit
+def alcove_trial(attention_weights, association_weights, inputs, targets, exemplars, c, r, attention_lr, association_lr):
+    '''
+    attention_weights <-- (1d array) [num_features] (updated in place)
+    association_weights <-- (2d array) [num_exemplars x num_categories] (updated in place)
+    inputs, targets <-- (1d arrays) a single item & its teacher values
+    returns output activations [num_categories] from before the update
+    '''
+    num_exemplars, num_features = exemplars.shape
+    num_categories = association_weights.shape[1]
+
+    ## forward
+    hidden = np.empty(num_exemplars)
+    for j in range(num_exemplars):
+        total = 0.0
+        for d in range(num_features):
+            total += attention_weights[d] * np.abs(inputs[d] - exemplars[j, d]) ** r
+        hidden[j] = np.exp(-c * total ** (1 / r))
+
+    output = np.zeros(num_categories)
+    for j in range(num_exemplars):
+        for k in range(num_categories):
+            output[k] += hidden[j] * association_weights[j, k]
+
+    ## humble teacher (max(1,t) on the correct category, min(-1,t) on the others)
+    error = np.empty(num_categories)
+    for k in range(num_categories):
+        error[k] = max(output[k] * targets[k], 1.0) * targets[k] - output[k]
+
+    ## attention gradients (from the weights before this update)
+    attention_grad = np.zeros(num_features)
+    for j in range(num_exemplars):
+        backprop = 0.0
+        for k in range(num_categories):
+            backprop += association_weights[j, k] * error[k]
+        backprop *= c * hidden[j]
+        for d in range(num_features):
+            attention_grad[d] -= backprop * np.abs(exemplars[j, d] - inputs[d])
+
+    ## updates
+    for d in range(num_features):
+        attention_weights[d] += attention_lr * attention_grad[d]
+        if attention_weights[d] < 0: attention_weights[d] = 0.0
+
+    for j in range(num_exemplars):
+        for k in range(num_categories):
+            association_weights[j, k] += association_lr * error[k] * hidden[j]
+
+    return output
+
+
+@jit
+def network_trial(input_weights, input_bias, hidden_weights, hidden_bias, inputs, targets, lr,
+                  hidden_activation, hidden_activation_deriv, output_activation, output_activation_deriv):
+    '''
+    weights & biases <-- (2d arrays) one encoder (input -to- hidden) & one decoder (hidden -to- output), updated in place
+    inputs, targets <-- (2d arrays) [1 x num_features] & [1 x num_outputs]
+    returns output activations [1 x num_outputs] from before the update
+    '''
+    dtype = input_weights.dtype # <-- compiled activations can promote float32 (e.g., 1 + x), so results are cast back
+
+    hidden_act_raw = np.dot(inputs, input_weights) + input_bias
+    hidden_act = hidden_activation(hidden_act_raw).astype(dtype)
+
+    output_act_raw = np.dot(hidden_act, hidden_weights) + hidden_bias
+    output_act = output_activation(output_act_raw).astype(dtype)
+
+    ## gradients (sum squared error), all taken before any weight moves
+    decode_grad = (output_activation_deriv(output_act_raw) * (2 * (output_act - targets)) / inputs.shape[0]).astype(dtype)
+    encode_grad = (hidden_activation_deriv(hidden_act_raw) * np.dot(decode_grad, hidden_weights.T)).astype(dtype)
+
+    hidden_weights -= lr * np.dot(hidden_act.T, decode_grad)
+    hidden_bias -= lr * np.sum(decode_grad, axis = 0)
+    input_weights -= lr * np.dot(inputs.T, encode_grad)
+    input_bias -= lr * np.sum(encode_grad, axis = 0)
+
+    return output_act
@@ -0,0 +1,114 @@
+'''
+Benchmarks
+- - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+--- Usage ---
+    python benchmarks.py distances [num_inputs num_exemplars num_features]
+    python benchmarks.py binary_distances [num_inputs num_exemplars num_features]
+    python benchmarks.py alcove_trials [num_exemplars num_features num_trials]
+
+--- Benchmarks ---
+    - distances <-- metric-dispatched pdist kernels vs the generic blocked minkowski kernel
+    - binary_distances <-- bit-packed xor/popcount kernel vs the cityblock kernel on 0/1 features
+    - alcove_trials <-- trials/second of alcove.trial_step (& the numba kernel) vs loss_grad + update_params
+'''
+## external requirements
+import sys
+import time
+import numpy as np
+
+## local requirements
+import distances
+import alcove
+import backends
+
+
+## best wall-clock time (seconds) over a few repeats
+def timeit(func, repeats = 3):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+## - - - - - - - - - - - - - - - - - -
+## distances
+## - - - - - - - - - - - - - - - - - -
+def bench_distances(num_inputs = 10000, num_exemplars = 10000, num_features = 50):
+    inputs = np.random.uniform(0, 1, [num_inputs, num_features])
+    exemplars = np.random.uniform(0, 1, [num_exemplars, num_features])
+    attention_weights = np.random.dirichlet(np.ones(num_features)).reshape(1, -1)
+    out = np.empty([num_inputs, num_exemplars])
+
+    print('pdist: {} inputs x {} exemplars x {} features'.format(num_inputs, num_exemplars, num_features))
+    for r, metric in [(2, 'euclidean'), (1, 'cityblock')]:
+        generic = timeit(lambda: distances.pdist(inputs, exemplars, r, attention_weights = attention_weights, out = out, metric = 'minkowski'), repeats = 1)
+        fast = timeit(lambda: distances.pdist(inputs, exemplars, r, attention_weights = attention_weights, out = out))
+
+        print('    r = {} | minkowski: {:.3f}s | {}: {:.3f}s | speedup: {:.1f}x'.format(r, generic, metric, fast, generic / fast))
+
+
+def bench_binary_distances(num_inputs = 2000, num_exemplars = 2000, num_features = 512):
+    inputs = np.random.randint(0, 2, [num_inputs, num_features])
+    exemplars = np.random.randint(0, 2, [num_exemplars, num_features])
+    out = np.empty([num_inputs, num_exemplars])
+
+    print('pdist (binary): {} inputs x {} exemplars x {} features'.format(num_inputs, num_exemplars, num_features))
+    cityblock = timeit(lambda: distances.pdist(inputs, exemplars, 1, out = out, metric = 'cityblock'), repeats = 1)
+    binary = timeit(lambda: distances.pdist(inputs, exemplars, 1, out = out, metric = 'binary'))
+
+    print('    cityblock: {:.3f}s | binary: {:.3f}s | speedup: {:.1f}x'.format(cityblock, binary, cityblock / binary))
+    print('    packed size: {} bytes vs {} bytes'.format(distances.pack_binary(inputs).nbytes, inputs.astype(np.float64).nbytes))
+
+
+## - - - - - - - - - - - - - - - - - -
+## alcove
+## - - - - - - - - - - - - - - - - - -
+def bench_alcove_trials(num_exemplars = 64, num_features = 8, num_trials = 5000):
+    exemplars = np.random.randint(0, 2, [num_exemplars, num_features]).astype(np.float64)
+    targets = np.eye(2)[np.random.randint(0, 2, num_exemplars)] * 2 - 1
+    order = np.random.randint(0, num_exemplars, num_trials)
+    c, r, attention_lr, association_lr = 1, 1, .1, .1
+
+    def reference():
+        params = alcove.build_params(num_features, num_exemplars, 2)
+        for i in order:
+            params = alcove.update_params(
+                params,
+                alcove.loss_grad(params, exemplars[i:i+1,:], exemplars, c, r, targets[i:i+1,:]),
+                attention_lr, association_lr,
+            )
+
+    def workspace():
+        params = alcove.build_params(num_features, num_exemplars, 2)
+        ws = alcove.build_workspace(num_features, num_exemplars, 2)
+        for i in order:
+            alcove.trial_step(params, ws, exemplars[i], targets[i], exemplars, c, r, attention_lr, association_lr)
+
+    def compiled():
+        params = alcove.build_params(num_features, num_exemplars, 2)
+        for i in order:
+            backends.alcove_trial(params['attention_weights'].reshape(-1), params['association_weights'], exemplars[i], targets[i], exemplars, c, r, attention_lr, association_lr)
+
+    print('alcove trials: {} exemplars x {} features, {} trials'.format(num_exemplars, num_features, num_trials))
+    print('    loss_grad + update_params: {:.0f} trials/s'.format(num_trials / timeit(reference)))
+    print('    trial_step: {:.0f} trials/s'.format(num_trials / timeit(workspace)))
+    if backends.numba is not None:
+        compiled() # <-- compile outside the timing
+        print('    numba alcove_trial: {:.0f} trials/s'.format(num_trials / timeit(compiled)))
+
+
+## - - - - - - - - - - - - - - - - - -
+## RUN BENCHMARKS
+## - - - - - - - - - - - - - - - - - -
+if __name__ == '__main__':
+    benchmarks = {
+        'distances': bench_distances,
+        'binary_distances': bench_binary_distances,
+        'alcove_trials': bench_alcove_trials,
+    }
+
+    name = sys.argv[1] if len(sys.argv) > 1 else 'distances'
+    benchmarks[name](*[int(arg) for arg in sys.argv[2:]])
@@ -0,0 +1,61 @@
+'''
+_ _ _ Choice Rules _ _ _
+- - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+--- Functions ---
+    - softmax <-- exponentiated luce-choice rule, exp(phi * x) / sum(exp(phi * x))
+    - log_softmax <-- log of the above
+    - luce <-- luce-choice ratio without exponentiation, x / sum(x)
+    - log_luce <-- log of the above
+    - error_ratio <-- DIVA-style ratio, 1 - error / sum(error)
+    - nll <-- negative log-likelihood of targets (one-hot or counts) under the softmax, straight from the logits
+
+--- Notes ---
+    - shared by gcm.py, prototype.py, alcove.py, diva.py, fitting.py & the mlc family
+    - everything is computed in log space (row max subtracted first) with a single exponentiation, so large phi can't overflow
+    - inputs are never modified; results are written into 'out' when one is given
+'''
+## external requirements
+import numpy as np
+
+
+## phi * x - max(phi * x) along the axis (written into out)
+def _shift(x, phi, axis, out):
+    out = np.multiply(x, phi, out = out, dtype = np.result_type(x, phi, np.float32) if out is None else None) # <-- ints --> float64, float32 stays float32
+    out -= np.max(out, axis = axis, keepdims = True)
+    return out
+
+
+def softmax(x, phi = 1, axis = 1, out = None):
+    out = np.exp(_shift(x, phi, axis, out), out = out)
+    out /= np.sum(out, axis = axis, keepdims = True)
+    return out
+
+
+def log_softmax(x, phi = 1, axis = 1, out = None):
+    out = _shift(x, phi, axis, out)
+    out -= np.log(np.sum(np.exp(out), axis = axis, keepdims = True))
+    return out
+
+
+def luce(x, axis = 1, out = None):
+    return np.divide(x, np.sum(x, axis = axis, keepdims = True), out = out)
+
+
+def log_luce(x, axis = 1, out = None):
+    out = np.log(x, out = out)
+    out -= np.log(np.sum(x, axis = axis, keepdims = True))
+    return out
+
+
+## 1 - err / sum(err) (same as "1/err / sum(1/err)" for two channels, but a lot more computationally stable)
+def error_ratio(errors, axis = 0, out = None):
+    out = np.divide(errors, np.sum(errors, axis = axis, keepdims = True), out = out)
+    return np.subtract(1, out, out = out)
+
+
+## -sum(targets * log softmax(phi * x)) without building the probabilities
+def nll(x, targets, phi = 1, axis = 1):
+    shifted = _shift(x, phi, axis, None)
+    log_normalizer = np.log(np.sum(np.exp(shifted), axis = axis, keepdims = True))
+    return np.sum(np.sum(targets, axis = axis, keepdims = True) * log_normalizer) - np.sum(targets * shifted)
@@ -0,0 +1,348 @@
+'''
+_ _ _ Distance Functions _ _ _
+- - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+--- Functions ---
+    - pdist <-- attention weighted minkowski distances (dispatches to the fastest kernel for r)
+    - euclidean_pdist <-- r = 2, via a weighted inner product (matmul)
+    - cityblock_pdist <-- r = 1, blocked weighted sum of absolute differences
+    - minkowski_pdist <-- any r, blocked generic kernel
+    - compiled_pdist <-- any r, numba compiled loops (backend = 'numba')
+    - binary_pdist <-- any r on 0/1 features, via xor + popcount on bit-packed uint64 words
+    - build_index <-- kd-tree over exemplars in the attention weighted metric (requires scipy)
+    - query_index <-- sparse distances to exemplars within a radius and/or the k nearest
+    - build_difference_cache <-- precomputed |a - b| ** r per dimension, for when only attention changes
+    - cached_pdist <-- distances from a difference cache (one [pairs x features] . [features] matvec)
+
+--- Notes ---
+    - shared by gcm.py, alcove.py & prototype.py
+    - all kernels write into a preallocated [num_inputs x num_exemplars] output (or one passed in as 'out')
+    - blocked kernels keep each (inputs x exemplars x features) intermediate under 'max_bytes'
+    - on 0/1 features |a - b| ** r == |a - b|, so every minkowski distance reduces to a weighted hamming distance
+    - sum(w * |a - b| ** r) == sum(|w**(1/r) * a - w**(1/r) * b| ** r), so the index is a plain minkowski kd-tree over rescaled exemplars
+'''
+## external requirements
+import numpy as np
+
+## local requirements
+from utils import fingerprint
+import backends
+
+## number of set bits in every possible byte (popcount fallback for numpy < 2.0)
+POPCOUNT_TABLE = np.array([bin(byte).count('1') for byte in range(256)], dtype = np.uint8)
+
+
+## number of inputs & exemplars per block so that a [inputs x exemplars x features] float64 tensor fits in max_bytes
+def block_sizes(num_features, num_exemplars, max_bytes):
+    pairs_per_block = max(1, max_bytes // (max(1, num_features) * np.dtype(np.float64).itemsize))
+    exemplar_block = int(min(max(1, num_exemplars), pairs_per_block))
+    input_block = int(max(1, pairs_per_block // exemplar_block))
+    return input_block, exemplar_block
+
+
+## minkowski pairwise distance function (https://en.wikipedia.org/wiki/Minkowski_distance)
+def pdist(a1, a2, r, **kwargs):
+    '''
+    a1 <-- (2d array) inputs [num_inputs x num_features]
+    a2 <-- (2d array) exemplars [num_exemplars x num_features]
+    r <-- (numeric) minkowski exponent (1: cityblock, 2: euclidean)
+    attention_weights = [1/num_features, ...] <-- (2d array) [1 x num_features]
+    max_bytes = 2 ** 27 <-- (int) memory budget for the intermediate difference tensor of each block
+    out = None <-- (2d array) preallocated output [num_inputs x num_exemplars]
+    metric = 'auto' <-- (str) 'auto' picks a kernel from r & the inputs; 'euclidean', 'cityblock', 'minkowski' or 'binary' force one
+    cache = None <-- (dict) difference cache from build_difference_cache (refreshed automatically if a1, a2 or r changed)
+    backend = 'numpy' <-- (str) 'numba' (or 'auto') runs the cityblock & minkowski kernels compiled (see backends.py)
+    '''
+    metric = kwargs.pop('metric', 'auto')
+    cache = kwargs.pop('cache', None)
+    backend = backends.resolve(kwargs.pop('backend', 'numpy'))
+
+    if cache is not None:
+        return cached_pdist(cache, a1, a2, r, **kwargs)
+
+    if metric == 'auto':
+        if use_binary(a1, a2, kwargs.get('attention_weights', None)):
+            metric = 'binary'
+        else:
+            metric = {1: 'cityblock', 2: 'euclidean'}.get(r, 'minkowski')
+
+    if backend == 'numba' and metric in ['cityblock', 'minkowski']:
+        return compiled_pdist(a1, a2, r, **kwargs)
+
+    if metric == 'euclidean':
+        return euclidean_pdist(a1, a2, **kwargs)
+    elif metric == 'cityblock':
+        return cityblock_pdist(a1, a2, **kwargs)
+    elif metric == 'minkowski':
+        return minkowski_pdist(a1, a2, r, **kwargs)
+    elif metric == 'binary':
+        return binary_pdist(a1, a2, r, **kwargs)
+    else:
+        raise ValueError('unknown metric: ' + str(metric))
+
+
+## r = 2 --> ||a||^2 + ||b||^2 - 2 * a W b^T (handed to BLAS instead of building the difference tensor)
+def euclidean_pdist(a1, a2, **kwargs):
+    attention_weights = kwargs.get('attention_weights', np.ones([1,a1.shape[1]]) / a1.shape[1])
+    max_bytes = kwargs.get('max_bytes', 2 ** 27)
+    out = kwargs.get('out', None)
+
+    if out is None: out = np.empty([a1.shape[0], a2.shape[0]])
+
+    a1 = np.asarray(a1, dtype = np.float64)
+    a2 = np.asarray(a2, dtype = np.float64)
+    attention_weights = np.asarray(attention_weights, dtype = np.float64).reshape(1, -1)
+
+    # distances don't change under a shared shift, but centering keeps the norms (& so the cancellation error) on the
+    # scale of the spread of the stimuli rather than of their distance from the origin
+    center = (a1.sum(axis = 0) + a2.sum(axis = 0)) / max(1, a1.shape[0] + a2.shape[0])
+    a1 = a1 - center
+    a2 = a2 - center
+
+    a1_norms = np.matmul(a1 ** 2, attention_weights.T) # <-- [num_inputs x 1]
+    a2_norms = np.matmul(a2 ** 2, attention_weights.T).T # <-- [1 x num_exemplars]
+    weighted_a2 = (a2 * attention_weights).T # <-- [num_features x num_exemplars]
+
+    tolerance = np.sqrt(np.finfo(np.float64).eps)
+    input_block = int(max(1, max_bytes // (max(1, a2.shape[0]) * np.dtype(np.float64).itemsize)))
+    pairs_per_block = int(max(1, max_bytes // (max(1, a1.shape[1]) * np.dtype(np.float64).itemsize)))
+
+    for i in range(0, a1.shape[0], input_block):
+        block = out[i:i+input_block]
+        np.matmul(a1[i:i+input_block], weighted_a2, out = block)
+        block *= -2
+        block += a1_norms[i:i+input_block]
+        block += a2_norms
+
+        # the expansion's error is a few ulps of the norms, so pairs within sqrt(eps) of them (identical ones included)
+        # are recomputed from their differences, which keeps every distance to ~1e-8 relative error or better
+        rows, cols = np.nonzero(block <= tolerance * (a1_norms[i:i+input_block] + a2_norms))
+        for k in range(0, rows.shape[0], pairs_per_block):
+            pair_rows, pair_cols = rows[k:k+pairs_per_block], cols[k:k+pairs_per_block]
+            block[pair_rows, pair_cols] = np.matmul((a1[i + pair_rows] - a2[pair_cols]) ** 2, attention_weights[0])
+
+        np.sqrt(block, out = block)
+
+    return out
+
+
+## r = 1 --> weighted sum of absolute differences (no powers needed)
+def cityblock_pdist(a1, a2, **kwargs):
+    attention_weights = kwargs.get('attention_weights', np.ones([1,a1.shape[1]]) / a1.shape[1])
+    max_bytes = kwargs.get('max_bytes', 2 ** 27)
+    out = kwargs.get('out', None)
+
+    if out is None: out = np.empty([a1.shape[0], a2.shape[0]])
+
+    attention_weights = np.asarray(attention_weights, dtype = np.float64).reshape(-1)
+    input_block, exemplar_block = block_sizes(a1.shape[1], a2.shape[0], max_bytes)
+
+    for i in range(0, a1.shape[0], input_block):
+        for j in range(0, a2.shape[0], exemplar_block):
+            out[i:i+input_block, j:j+exemplar_block] = np.matmul(
+                np.abs(a1[i:i+input_block, None, :] - a2[None, j:j+exemplar_block, :]),
+                attention_weights
+            )
+
+    return out
+
+
+## any r --> generic blocked kernel
+def minkowski_pdist(a1, a2, r, **kwargs):
+    attention_weights = kwargs.get('attention_weights', np.ones([1,a1.shape[1]]) / a1.shape[1])
+    max_bytes = kwargs.get('max_bytes', 2 ** 27)
+    out = kwargs.get('out', None)
+
+    if out is None: out = np.empty([a1.shape[0], a2.shape[0]])
+
+    input_block, exemplar_block = block_sizes(a1.shape[1], a2.shape[0], max_bytes)
+
+    for i in range(0, a1.shape[0], input_block):
+        for j in range(0, a2.shape[0], exemplar_block):
+            out[i:i+input_block, j:j+exemplar_block] = np.power(
+                np.sum(
+                    np.multiply(
+                        attention_weights,
+                        np.abs(a1[i:i+input_block, None, :] - a2[None, j:j+exemplar_block, :]) ** r
+                    ),
+                    axis = 2,
+                ),
+                1/r
+            )
+
+    return out
+
+
+## any r --> numba compiled loops (no intermediate tensor at all)
+def compiled_pdist(a1, a2, r, **kwargs):
+    attention_weights = kwargs.get('attention_weights', np.ones([1,a1.shape[1]]) / a1.shape[1])
+    out = kwargs.get('out', None)
+
+    if out is None: out = np.empty([a1.shape[0], a2.shape[0]])
+
+    return backends.minkowski_kernel(
+        np.asarray(a1, dtype = np.float64),
+        np.asarray(a2, dtype = np.float64),
+        float(r),
+        np.asarray(attention_weights, dtype = np.float64).reshape(-1),
+        out,
+    )
+
+
+## - - - - - - - - - - - - - - - - - -
+## binary (0/1) features
+## - - - - - - - - - - - - - - - - - -
+
+## true if every value in the array is 0 or 1
+def is_binary(a):
+    return bool(np.all((a == 0) | (a == 1)))
+
+
+## packing only pays off when each group of equally weighted dimensions fills at least one 64-bit word on average
+def use_binary(a1, a2, attention_weights = None):
+    if attention_weights is None:
+        num_groups = 1
+    else:
+        num_groups = np.unique(attention_weights).size
+
+    if num_groups * 64 > a1.shape[1]: return False
+    return is_binary(a1) and is_binary(a2)
+
+
+## pack the columns of a 0/1 array into [num_rows x num_words] uint64 words
+def pack_binary(a):
+    packed = np.packbits(np.asarray(a, dtype = np.uint8), axis = 1)
+    packed = np.pad(packed, [[0, 0], [0, -packed.shape[1] % 8]]) # <-- pad bytes to whole 64-bit words
+    return np.ascontiguousarray(packed).view(np.uint64)
+
+
+## number of set bits, summed over the last (word) axis
+def popcount(words):
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words).sum(axis = -1, dtype = np.int64)
+    return POPCOUNT_TABLE[words.view(np.uint8)].sum(axis = -1, dtype = np.int64)
+
+
+## weighted hamming distance --> (sum of attention * xor) ** (1/r), dimensions with equal attention share packed words
+def binary_pdist(a1, a2, r, **kwargs):
+    attention_weights = kwargs.get('attention_weights', np.ones([1,a1.shape[1]]) / a1.shape[1])
+    max_bytes = kwargs.get('max_bytes', 2 ** 27)
+    out = kwargs.get('out', None)
+
+    if out is None: out = np.empty([a1.shape[0], a2.shape[0]])
+    out[...] = 0
+
+    attention_weights = np.asarray(attention_weights, dtype = np.float64).reshape(-1)
+    group_weights, groups = np.unique(attention_weights, return_inverse = True)
+
+    for group, weight in enumerate(group_weights):
+        if weight == 0: continue
+
+        a1_packed = pack_binary(a1[:, groups == group])
+        a2_packed = pack_binary(a2[:, groups == group])
+        input_block, exemplar_block = block_sizes(a1_packed.shape[1], a2_packed.shape[0], max_bytes)
+
+        for i in range(0, a1_packed.shape[0], input_block):
+            for j in range(0, a2_packed.shape[0], exemplar_block):
+                out[i:i+input_block, j:j+exemplar_block] += weight * popcount(
+                    np.bitwise_xor(
+                        a1_packed[i:i+input_block, None, :],
+                        a2_packed[None, j:j+exemplar_block, :]
+                    )
+                )
+
+    if r != 1: np.power(out, 1/r, out = out)
+    return out
+
+
+## - - - - - - - - - - - - - - - - - -
+## exemplar index
+## - - - - - - - - - - - - - - - - - -
+
+## kd-tree over the exemplars, rescaled so that plain minkowski distances equal attention weighted ones
+def build_index(exemplars, r, attention_weights = None):
+    '''
+    exemplars <-- (2d array) [num_exemplars x num_features]
+    r <-- (numeric) minkowski exponent (>= 1)
+    attention_weights = [1/num_features, ...] <-- (2d array) [1 x num_features]
+    '''
+    from scipy.spatial import cKDTree # <-- optional requirement
+
+    if r < 1: raise ValueError('exemplar index needs a metric minkowski distance (r >= 1), got r = ' + str(r))
+    if attention_weights is None: attention_weights = np.ones([1, exemplars.shape[1]]) / exemplars.shape[1]
+
+    scale = np.asarray(attention_weights, dtype = np.float64).reshape(1, -1) ** (1/r)
+
+    return {
+        'tree': cKDTree(exemplars * scale),
+        'scale': scale,
+        'r': r,
+        'attention_weights': np.array(attention_weights, dtype = np.float64).reshape(1, -1),
+        'num_exemplars': exemplars.shape[0],
+    }
+
+
+## distances from each input to the exemplars inside 'radius' and/or its 'k' nearest, as (rows, cols, distances)
+def query_index(index, inputs, radius = None, k = None):
+    from scipy.spatial import cKDTree # <-- optional requirement
+
+    scaled_inputs = inputs * index['scale']
+
+    if k is not None:
+        k = min(k, index['num_exemplars'])
+        distances, cols = index['tree'].query(
+            scaled_inputs, k = k, p = index['r'],
+            distance_upper_bound = np.inf if radius is None else radius,
+        )
+        distances, cols = distances.reshape(inputs.shape[0], k), cols.reshape(inputs.shape[0], k)
+        rows = np.repeat(np.arange(inputs.shape[0]), k).reshape(inputs.shape[0], k)
+
+        found = cols < index['num_exemplars'] # <-- missing neighbors (beyond the radius) come back as index == num_exemplars
+        return rows[found], cols[found], distances[found]
+
+    if radius is None: raise ValueError('query_index needs a radius, k, or both')
+
+    pairs = cKDTree(scaled_inputs).sparse_distance_matrix(
+        index['tree'], radius, p = index['r'], output_type = 'ndarray'
+    )
+    return pairs['i'], pairs['j'], pairs['v']
+
+
+## - - - - - - - - - - - - - - - - - -
+## difference cache
+## - - - - - - - - - - - - - - - - - -
+
+## |a1 - a2| ** r for every (input, exemplar) pair & dimension, flattened to [num_pairs x num_features]
+def build_difference_cache(a1, a2, r):
+    '''
+    a1 <-- (2d array) inputs [num_inputs x num_features]
+    a2 <-- (2d array) exemplars [num_exemplars x num_features]
+    r <-- (numeric) minkowski exponent
+
+    note: holds num_inputs * num_exemplars * num_features floats, so only use it when that fits in memory
+    '''
+    return {
+        'r': r,
+        'a1_key': fingerprint(a1),
+        'a2_key': fingerprint(a2),
+        'shape': (a1.shape[0], a2.shape[0]),
+        'differences': (np.abs(a1[:, None, :] - a2[None, :, :]) ** r).reshape(-1, a1.shape[1]).astype(np.float64),
+    }
+
+
+## distances from a difference cache; the cache is rebuilt in place if it was made for other arrays or another r
+def cached_pdist(cache, a1, a2, r, **kwargs):
+    attention_weights = kwargs.get('attention_weights', np.ones([1,a1.shape[1]]) / a1.shape[1])
+    out = kwargs.get('out', None)
+
+    if cache.get('r', None) != r or cache.get('a1_key', None) != fingerprint(a1) or cache.get('a2_key', None) != fingerprint(a2):
+        cache.update(build_difference_cache(a1, a2, r))
+
+    if out is None: out = np.empty(cache['shape'])
+
+    distances = np.matmul(
+        cache['differences'],
+        np.asarray(attention_weights, dtype = np.float64).reshape(-1)
+    ).reshape(cache['shape'])
+
+    return np.power(distances, 1/r, out = out)
@@ -4,24 +4,45 @@ DIVergent Autoencoder (Kurtz, 2007)
 
 --- Functions ---
     - forward <-- get model outputs
+    - forward_channels <-- fused forward for many channels (encoder once, decoders as one stacked contraction)
+    - stack_decoders <-- channel decoder weights & biases as [num_channels x num_hidden x num_features] & [num_channels x 1 x num_features]
     - loss <-- cost function
     - loss_grad <-- returns gradients
+    - loss_grad_batch <-- gradients for a minibatch with mixed labels (one encoder pass, one decoder matmul per channel)
     - response <-- luce-choice rule (ie, softmax without exponentiation)
+    - channel_response <-- response from already computed channel reconstructions
     - focusing <-- biases impact of diverse dimensions during reconstruction
+    - all_pairs_diversity <-- sum of |differences| over every pair of channels (sort based, O(C log C))
     - fit <-- trains model on a number of epochs
+    - fit_iter <-- same training as fit, as a generator of per-trial learning records
     - predict <-- gets class predictions
     - build_params <-- returns dictionary of weights
     - update_params <-- updates weights
+    - build_ensemble <-- stacks num_networks independently initialized networks along a leading axis
+    - ensemble_member <-- one network of an ensemble as an ordinary params dictionary
+    - fit_ensemble <-- trains every network of an ensemble in lockstep (batched matmuls; own presentation orders)
+    - ensemble_response <-- response averaged over the networks of an ensemble
 
 
 --- Notes ---
     - implements sum-squared-error cost function
+    - fit(..., batch_size = n) trains on minibatches of the shuffled presentation order (mean sum squared error per batch);
+      batch_size = 1 gives the same updates as the default online training
+    - fit(..., backend = 'numba') runs each trial through a compiled kernel (optional numba requirement, see backends.py)
+    - ensembles hold 'input' -> 'hidden' weights [num_networks x num_features x num_hidden] (& biases), decoders in 'decoders'
+      as [num_networks x num_channels x num_hidden x num_features] (& biases) & the channel order in 'channels'
     - hidden activation function & derivative have to be provided in 'hps' dictionary (there are some available in the utils.py script)
 '''
 
 ## external requirements
 import numpy as np
 
+## local requirements
+import choice_rules
+import backends
+import utils
+import precision
+
 
 ## "forward pass"
 def forward(params, inputs, channel, hps):
@@ -48,13 +69,63 @@ def forward(params, inputs, channel, hps):
     return [hidden_act_raw, hidden_act, output_act_raw, output_act]
 
 
+## stacked decoders, in the order of 'channels'
+def stack_decoders(params, channels):
+    return (
+        np.stack([params['hidden'][channel]['weights'] for channel in channels]),
+        np.stack([params['hidden'][channel]['bias'] for channel in channels]),
+    )
+
+
+## "forward pass" through every channel at once; the encoding is shared, so it is only computed once
+def forward_channels(params, inputs, channels, hps):
+    '''
+    returns [hidden_act_raw, hidden_act, output_act_raw, output_act] where the output activations are
+        [num_channels x num_items x num_features] (in the order of 'channels')
+    '''
+    hidden_act_raw = np.add(
+        np.matmul(
+            inputs,
+            params['input']['hidden']['weights']
+        ),
+        params['input']['hidden']['bias']
+    )
+
+    hidden_act = hps['hidden_activation'](hidden_act_raw)
+
+    decoder_weights, decoder_bias = stack_decoders(params, channels)
+    output_act_raw = np.add(
+        np.matmul(
+            hidden_act, # <-- broadcast against the channel axis
+            decoder_weights
+        ),
+        decoder_bias
+    )
+
+    output_act = hps['output_activation'](output_act_raw)
+
+    return [hidden_act_raw, hidden_act, output_act_raw, output_act]
+
+
 ## cost function (sum squared error)
 def loss(params, inputs, channel, hps, targets = None):
+    '''
+    channel <-- one channel for every item, or (list) each item's own channel (label)
+    '''
     if np.any(targets) == None: targets = inputs
+
+    if np.ndim(channel) == 0:
+        output_act = forward(params, inputs, channel, hps)[-1]
+    else:
+        channels = list(dict.fromkeys(channel)) # <-- unique, in order of appearance
+        output_act = forward_channels(params, inputs, channels, hps)[-1][
+            [channels.index(label) for label in channel], np.arange(inputs.shape[0])
+        ]
+
     return np.sum(
         np.square(
             np.subtract(
-                forward(params, inputs, channel, hps)[-1],
+                output_act,
                 targets
             )
         )
@@ -62,10 +133,14 @@ def loss(params, inputs, channel, hps, targets = None):
 
 
 ## backprop (for sum squared error cost function)
-def loss_grad(params, inputs, channel, hps, targets = None):
+def loss_grad(params, inputs, channel, hps, targets = None, activations = None):
+    '''
+    activations = None <-- (list) forward(params, inputs, channel, hps) outputs, if they're already computed
+    '''
     if np.any(targets) == None: targets = inputs
+    if activations is None: activations = forward(params, inputs, channel, hps)
 
-    hidden_act_raw, hidden_act, output_act_raw, output_act = forward(params, inputs, channel, hps)
+    hidden_act_raw, hidden_act, output_act_raw, output_act = activations
 
     ## gradients for decode layer ( chain rule on cost function )
     decode_grad = np.multiply(
@@ -119,45 +194,136 @@ def loss_grad(params, inputs, channel, hps, targets = None):
 
 
 
-## luce choice w/ late-stage attention
-def response(params, inputs, channels, hps, targets = None, beta = 0):
+## backprop for a minibatch where every item goes through its own channel (label)
+def loss_grad_batch(params, inputs, labels, hps, targets = None):
+    '''
+    labels <-- (1d array) channel of each item
+
+    returns gradients of the mean (over items) sum squared error, with an entry in 'hidden' for each channel in the batch
+    '''
     if np.any(targets) == None: targets = inputs
+    labels = np.asarray(labels)
 
-    activations = np.array([
-        forward(params, inputs, channel, hps)[-1]
-        for channel in channels
-    ])
+    hidden_act_raw = np.add(
+        np.matmul(
+            inputs,
+            params['input']['hidden']['weights']
+        ),
+        params['input']['hidden']['bias']
+    )
+    hidden_act = hps['hidden_activation'](hidden_act_raw)
 
-    # get beta weights using paired differences
-    diversities = np.abs(
-        np.diff(activations, axis = 0)
-    ).sum(axis = 0)
+    ## each channel's items through its decoder; the backprop into the hidden layer is gathered for one encoder update
+    hidden_backprop = np.zeros_like(hidden_act)
+    decode_gradients = {}
+    for channel in np.unique(labels):
+        rows = labels == channel
+
+        output_act_raw = np.add(
+            np.matmul(
+                hidden_act[rows],
+                params['hidden'][channel]['weights']
+            ),
+            params['hidden'][channel]['bias'],
+        )
 
-    ## exponentiate & weight (beta) diversities
-    diversities = np.exp(
-        beta * diversities
+        decode_grad = np.multiply(
+            hps['output_activation_deriv'](output_act_raw),
+            (2 * (hps['output_activation'](output_act_raw) - targets[rows])) / inputs.shape[0] # <-- deriv of cost function
+        )
+
+        decode_gradients[channel] = {
+            'weights': np.matmul(hidden_act[rows].T, decode_grad),
+            'bias': decode_grad.sum(axis = 0, keepdims = True),
+        }
+        hidden_backprop[rows] = np.matmul(decode_grad, params['hidden'][channel]['weights'].T)
+
+    encode_grad = np.multiply(
+        hps['hidden_activation_deriv'](hidden_act_raw),
+        hidden_backprop
     )
 
-    ## softmax diversities
-    fweights = diversities / np.sum(diversities)
+    return {
+        'input': {
+            'hidden': {
+                'weights': np.matmul(inputs.T, encode_grad),
+                'bias': encode_grad.sum(axis = 0, keepdims = True),
+            }
+        },
+        'hidden': decode_gradients,
+    }
+
+
+## luce choice w/ late-stage attention
+def response(params, inputs, channels, hps, targets = None, beta = 0, focusing_mode = 'adjacent', chunk_size = None, out = None):
+    '''
+    focusing_mode = 'adjacent' <-- (str) diversity used for focusing: 'adjacent' channels or 'all_pairs' (see focusing)
+    chunk_size = None <-- (int) items scored at a time; all at once by default
+    out = None <-- (array) [num_channels x num_items x 1] to fill, or (str) .npy path for a memory-mapped result
+
+    note: the focusing softmax is normalized over the whole chunk, but that normalizer cancels in each item's error ratio,
+        so chunked results match the unchunked ones (to rounding)
+    '''
+    if np.any(targets) == None: targets = inputs
+    inputs, targets = precision.cast(inputs), precision.cast(targets)
+    if chunk_size is None and out is None:
+        return channel_response(forward_channels(params, inputs, channels, hps)[-1], targets, beta = beta, focusing_mode = focusing_mode)
+    if chunk_size is None: chunk_size = inputs.shape[0]
+
+    out = utils.open_output(out, [len(channels), inputs.shape[0], 1], dtype = precision.get_dtype())
+    for start in range(0, inputs.shape[0], chunk_size):
+        chunk = slice(start, start + chunk_size)
+        out[:, chunk] = channel_response(
+            forward_channels(params, inputs[chunk], channels, hps)[-1], targets[chunk], beta = beta, focusing_mode = focusing_mode
+        )
+
+    if isinstance(out, np.memmap): out.flush()
+    return out
+
 
+## luce choice w/ late-stage attention, from the reconstructions of every channel [num_channels x num_items x num_features]
+def channel_response(activations, targets, beta = 0, focusing_mode = 'adjacent'):
     channel_errors = np.sum(
         np.square(
             np.subtract(
                 targets,
                 activations
             )
-        ) * fweights,
+        ) * focusing(activations, beta = beta, mode = focusing_mode),
         axis = 2, keepdims = True
     )
 
-    return 1 - np.divide( # <-- this equation produces the same results as " 1/err_K / sum(1/err_K)", except seems to be a lot more computationaly stable
-        channel_errors,
-        np.sum(
-            channel_errors,
-            axis = 0
-        )
-    )
+    return choice_rules.error_ratio(channel_errors, axis = 0) # <-- same results as " 1/err_K / sum(1/err_K)", except a lot more computationaly stable
+
+
+## focusing weights: softmax (over every item & feature) of beta * the diversity of the channel reconstructions
+def focusing(activations, beta = 0, mode = 'adjacent'):
+    '''
+    activations <-- (3d array) channel reconstructions [num_channels x num_items x num_features]
+    mode = 'adjacent' <-- (str) 'adjacent' sums |differences| between neighbouring channels (in channel order);
+        'all_pairs' sums them over every pair of channels (see all_pairs_diversity)
+    '''
+    if mode == 'adjacent':
+        diversities = np.abs(
+            np.diff(activations, axis = 0)
+        ).sum(axis = 0)
+    elif mode == 'all_pairs':
+        diversities = all_pairs_diversity(activations)
+    else:
+        raise ValueError('unknown focusing mode: ' + str(mode))
+
+    return choice_rules.softmax(diversities, phi = beta, axis = None)
+
+
+## sum over every pair of channels of |a_i - a_j|, per item & feature, in O(C log C) instead of O(C^2)
+def all_pairs_diversity(activations):
+    '''
+    with the channels sorted (a_0 <= ... <= a_C-1), a_k is the larger value in k pairs & the smaller one in C-1-k,
+        so the sum is sum_k (2k - C + 1) a_k
+    '''
+    num_channels = activations.shape[0]
+    coefficients = 2 * np.arange(num_channels) - num_channels + 1
+    return np.tensordot(coefficients, np.sort(activations, axis = 0), axes = 1)
 
 
 ## build parameter dictionary
@@ -167,7 +333,7 @@ def build_params(num_features, num_hidden_nodes, categories, weight_range = [-1,
     num_hidden_nodes <-- (numeric)
     num_categories <-- number of category channels to make
     '''
-    return {
+    return precision.cast_params({
         'input': {
             'hidden': {
                 'weights': np.random.uniform(*weight_range, [num_features, num_hidden_nodes]),
@@ -183,7 +349,7 @@ def build_params(num_features, num_hidden_nodes, categories, weight_range = [-1,
                 for channel in categories
             }
         },
-    }
+    })
 
 
 ## build parameter dictionary
@@ -193,7 +359,7 @@ def build_params_xavier(num_features, num_hidden_nodes, categories): # <-- with
     num_hidden_nodes <-- (numeric)
     num_categories <-- number of category channels to make
     '''
-    return {
+    return precision.cast_params({
         'input': {
             'hidden': { # <-- xavier initialization for tanh outputs
                 'weights': np.random.normal(0, 1, [num_features, num_hidden_nodes]) * np.sqrt(2 / (num_features + num_hidden_nodes)),
@@ -209,7 +375,7 @@ def build_params_xavier(num_features, num_hidden_nodes, categories): # <-- with
                 for channel in categories
             }
         },
-    }
+    })
 
 
 
@@ -223,28 +389,210 @@ def update_params(params, gradients, lr):
 
 
 ## fit to training set
-def fit(params, inputs, labels, hps, targets = None, training_epochs = 1, randomize_presentation = True):
+def fit(params, inputs, labels, hps, targets = None, training_epochs = 1, randomize_presentation = True, backend = 'numpy', batch_size = None, criterion = None):
+    '''
+    backend = 'numpy' <-- (str) 'numba' (or 'auto') runs each trial as one compiled kernel (see backends.py)
+    batch_size = None <-- (int) items per update (loss_grad_batch); None trains online, one item at a time
+    criterion = None <-- (dict) {'accuracy': threshold} or {'loss': threshold}; trains online (numpy) & stops after the first
+        block (epoch) that meets it, returning (params, stopping trial) instead (stopping trial is None if training_epochs ran out first);
+        can't be combined with another backend or a batch_size (ValueError)
+    '''
+    if criterion is not None and (backend != 'numpy' or batch_size is not None):
+        raise ValueError('criterion trains online with the numpy backend; drop backend / batch_size or train without a criterion')
+
     if np.any(targets) == None: targets = inputs
+    inputs, targets = precision.cast(inputs), precision.cast(targets)
     presentation_order = np.arange(inputs.shape[0])
 
+    if criterion is not None:
+        channels = list(params['hidden'])
+        stopping_trial = utils.run_to_criterion(
+            fit_iter(params, inputs, labels, hps, targets = targets, training_epochs = training_epochs, randomize_presentation = randomize_presentation),
+            lambda record: channels.index(labels[record['item']]), criterion, inputs.shape[0]
+        )
+        return params, stopping_trial
+
+    if batch_size is not None:
+        labels = np.asarray(labels)
+        for e in range(training_epochs):
+            if randomize_presentation == True: np.random.shuffle(presentation_order)
+
+            for start in range(0, inputs.shape[0], batch_size):
+                batch = presentation_order[start:start + batch_size]
+                gradients = loss_grad_batch(params, inputs[batch], labels[batch], hps, targets = targets[batch])
+                params = update_params(params, gradients, hps['learning_rate'])
+
+        return params
+
+    activations = backends.network_activations(hps, backend)
+
     for e in range(training_epochs):
         if randomize_presentation == True: np.random.shuffle(presentation_order)
         
-        for i in range(inputs.shape[0]):
+        for i in presentation_order:
+            if activations is not None:
+                backends.network_trial(
+                    params['input']['hidden']['weights'], params['input']['hidden']['bias'],
+                    params['hidden'][labels[i]]['weights'], params['hidden'][labels[i]]['bias'],
+                    inputs[i:i+1,:], targets[i:i+1,:], hps['learning_rate'], *activations
+                )
+                continue
+
             gradients = loss_grad(params, inputs[i:i+1,:], labels[i], hps, targets = targets[i:i+1,:])
             params = update_params(params, gradients, hps['learning_rate'])
 
     return params
 
+
+## learning trajectory: trains like fit, yielding a lightweight record per trial along the way
+def fit_iter(params, inputs, labels, hps, targets = None, training_epochs = 1, randomize_presentation = True, beta = 0, focusing_mode = 'adjacent'):
+    '''
+    beta = 0, focusing_mode = 'adjacent' <-- focusing for the recorded response (see focusing)
+
+    yields dictionaries with 'epoch', 'trial', 'item', 'probabilities' (response of every channel, before the update)
+        & 'loss' (sum squared error of the item's own channel); params are updated in place
+    '''
+    if np.any(targets) == None: targets = inputs
+    inputs, targets = precision.cast(inputs), precision.cast(targets)
+    presentation_order = np.arange(inputs.shape[0])
+    channels = list(params['hidden'])
+
+    trial = 0
+    for e in range(training_epochs):
+        if randomize_presentation == True: np.random.shuffle(presentation_order)
+
+        for i in presentation_order:
+            activations = forward_channels(params, inputs[i:i+1,:], channels, hps)
+            own_activations = activations[:2] + [act[channels.index(labels[i])] for act in activations[2:]]
+
+            gradients = loss_grad(params, inputs[i:i+1,:], labels[i], hps, targets = targets[i:i+1,:], activations = own_activations)
+            params = update_params(params, gradients, hps['learning_rate'])
+
+            yield {
+                'epoch': e,
+                'trial': trial,
+                'item': i,
+                'probabilities': channel_response(activations[-1], targets[i:i+1,:], beta = beta, focusing_mode = focusing_mode).reshape(-1),
+                'loss': np.sum(np.square(own_activations[-1] - targets[i:i+1,:])),
+            }
+            trial += 1
+
+
 ## predict
 def predict(params, inputs, categories, hps, targets = None):
     if np.any(targets) == None: targets = inputs
+    inputs, targets = precision.cast(inputs), precision.cast(targets)
     return np.argmin(
         response(params, inputs, categories, hps, targets = targets),
         axis = 0
     )
 
 
+## num_networks independently initialized networks, stacked
+def build_ensemble(num_networks, num_features, num_hidden_nodes, categories, build = build_params_xavier):
+    '''
+    build = build_params_xavier <-- (callable) initializer for each network (e.g. build_params)
+    '''
+    channels = list(categories)
+    networks = [build(num_features, num_hidden_nodes, channels) for _ in range(num_networks)]
+    return {
+        'input': {
+            'hidden': {
+                'weights': np.stack([network['input']['hidden']['weights'] for network in networks]),
+                'bias': np.stack([network['input']['hidden']['bias'] for network in networks]),
+            },
+        },
+        'decoders': {
+            'weights': np.stack([stack_decoders(network, channels)[0] for network in networks]),
+            'bias': np.stack([stack_decoders(network, channels)[1] for network in networks]),
+        },
+        'channels': channels,
+    }
+
+
+## network k of an ensemble as an ordinary params dictionary (views into the ensemble weights)
+def ensemble_member(ensemble, k):
+    return {
+        'input': {
+            'hidden': {
+                'weights': ensemble['input']['hidden']['weights'][k],
+                'bias': ensemble['input']['hidden']['bias'][k],
+            },
+        },
+        'hidden': {
+            channel: {
+                'weights': ensemble['decoders']['weights'][k, c],
+                'bias': ensemble['decoders']['bias'][k, c],
+            }
+            for c, channel in enumerate(ensemble['channels'])
+        },
+    }
+
+
+## trains every network in lockstep; each trial is one item per network, through that item's channel (same updates as fit)
+def fit_ensemble(ensemble, inputs, labels, hps, targets = None, training_epochs = 1, randomize_presentation = True, presentation_orders = None):
+    '''
+    presentation_orders = None <-- (2d int array) [num_networks x num_trials] item each network sees on each trial;
+        by default every network gets its own shuffle of the items each epoch (or the item order, without randomize_presentation)
+    '''
+    if targets is None: targets = inputs
+    inputs, targets = precision.cast(inputs), precision.cast(targets)
+    num_networks = ensemble['input']['hidden']['weights'].shape[0]
+    networks = np.arange(num_networks)
+    channel_index = np.array([ensemble['channels'].index(label) for label in labels])
+
+    if presentation_orders is None:
+        presentation_orders = np.concatenate([
+            np.argsort(np.random.uniform(0, 1, [num_networks, inputs.shape[0]]), axis = 1) if randomize_presentation == True
+            else np.tile(np.arange(inputs.shape[0]), [num_networks, 1])
+            for _ in range(training_epochs)
+        ], axis = 1)
+
+    input_weights, input_bias = ensemble['input']['hidden']['weights'], ensemble['input']['hidden']['bias']
+    decoder_weights, decoder_bias = ensemble['decoders']['weights'], ensemble['decoders']['bias']
+
+    for items in np.asarray(presentation_orders, dtype = int).T:
+        x, t, channels = inputs[items][:, None, :], targets[items][:, None, :], channel_index[items] # <-- [num_networks x 1 x num_features]
+
+        ## forward (each network through its item's channel)
+        hidden_act_raw = np.matmul(x, input_weights) + input_bias
+        hidden_act = hps['hidden_activation'](hidden_act_raw)
+
+        weights = decoder_weights[networks, channels] # <-- gathered [num_networks x num_hidden x num_features]
+        output_act_raw = np.matmul(hidden_act, weights) + decoder_bias[networks, channels]
+        output_act = hps['output_activation'](output_act_raw)
+
+        ## backprop (sum squared error, one item)
+        decode_grad = hps['output_activation_deriv'](output_act_raw) * (2 * (output_act - t))
+        encode_grad = hps['hidden_activation_deriv'](hidden_act_raw) * np.matmul(decode_grad, weights.transpose(0, 2, 1))
+
+        ## updates (scattered back into each network's channel)
+        decoder_weights[networks, channels] -= hps['learning_rate'] * np.matmul(hidden_act.transpose(0, 2, 1), decode_grad)
+        decoder_bias[networks, channels] -= hps['learning_rate'] * decode_grad
+        input_weights -= hps['learning_rate'] * np.matmul(x.transpose(0, 2, 1), encode_grad)
+        input_bias -= hps['learning_rate'] * encode_grad
+
+    return ensemble
+
+
+## response of every network (channel_response), averaged over the ensemble [num_channels x num_items x 1]
+def ensemble_response(ensemble, inputs, hps, targets = None, beta = 0, focusing_mode = 'adjacent'):
+    if targets is None: targets = inputs
+    inputs, targets = precision.cast(inputs), precision.cast(targets)
+
+    hidden_act = hps['hidden_activation'](
+        np.matmul(inputs, ensemble['input']['hidden']['weights']) + ensemble['input']['hidden']['bias']
+    )
+    output_act = hps['output_activation'](
+        np.matmul(hidden_act[:, None], ensemble['decoders']['weights']) + ensemble['decoders']['bias']
+    ) # <-- [num_networks x num_channels x num_items x num_features]
+
+    return np.mean([
+        channel_response(network_output_act, targets, beta = beta, focusing_mode = focusing_mode)
+        for network_output_act in output_act
+    ], axis = 0)
+
+
 ## - - - - - - - - - - - - - - - - - -
 ## RUN MODEL
 ## - - - - - - - - - - - - - - - - - -
@@ -0,0 +1,175 @@
+'''
+Maximum Likelihood Fitting (GCM & Prototype)
+- - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+--- Functions ---
+    - nll <-- negative log-likelihood of observed response counts under the luce-choice response
+    - nll_grad <-- negative log-likelihood & its closed-form gradients w.r.t. c, phi & the attention weights
+    - fit <-- quasi-newton (L-BFGS-B) maximum likelihood fit of c, phi & attention
+
+--- Notes ---
+    - works for gcm.py & prototype.py: 'references' are the exemplars or the prototypes, and
+      params['association_weights'] maps them to categories
+    - c & phi are optimized on a log scale, attention through a softmax (so it stays on the simplex)
+    - distances come from a distances.build_difference_cache, so every evaluation is a matvec
+    - requires scipy (for the optimizer)
+'''
+## external requirements
+import numpy as np
+
+## local requirements
+import distances
+import choice_rules
+
+
+## negative log-likelihood of the counts
+def nll(params, inputs, references, counts, c, r, phi, cache = None):
+    '''
+    counts <-- (2d array) observed response counts [num_inputs x num_categories]
+    '''
+    if cache is None: cache = {}
+    output_activation = np.matmul(
+        np.exp((-c) * distances.pdist(inputs, references, r, attention_weights = params['attention_weights'], cache = cache)),
+        params['association_weights']
+    )
+    return choice_rules.nll(output_activation, counts, phi = phi)
+
+
+## negative log-likelihood & closed-form gradients
+def nll_grad(params, inputs, references, counts, c, r, phi, cache = None):
+    '''
+    returns (nll, gradients) where gradients is a dictionary with 'c', 'phi' & 'attention_weights' ([1 x num_features])
+    '''
+    if cache is None: cache = {}
+
+    distance = distances.pdist(inputs, references, r, attention_weights = params['attention_weights'], cache = cache)
+    hidden_activation = np.exp((-c) * distance)
+    output_activation = np.matmul(hidden_activation, params['association_weights'])
+    log_probabilities = choice_rules.log_softmax(output_activation, phi = phi)
+
+    ## d nll / d logits = n * p - counts (softmax cross-entropy)
+    logit_grad = np.sum(counts, axis = 1, keepdims = True) * np.exp(log_probabilities) - counts
+
+    ## back through the association weights to the reference (hidden) layer
+    hidden_grad = phi * np.matmul(logit_grad, params['association_weights'].T)
+
+    ## back through exp(-c * d)
+    distance_grad = hidden_grad * (-c) * hidden_activation
+
+    ## back through d = (sum_k w_k |a_k - b_k| ** r) ** (1/r) --> d d / d w_k = |a_k - b_k| ** r * d ** (1 - r) / r
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        chain = np.where(distance > 0, distance ** (1 - r) / r, 0)
+
+    attention_grad = np.matmul(
+        (distance_grad * chain).reshape(-1),
+        cache['differences'],
+    ).reshape(1, -1)
+
+    return -np.sum(counts * log_probabilities), {
+        'c': np.sum(hidden_grad * (-distance) * hidden_activation),
+        'phi': np.sum(logit_grad * output_activation),
+        'attention_weights': attention_grad,
+    }
+
+
+## maximum likelihood fit
+def fit(params, inputs, references, counts, c, r, phi, fit_attention = True, options = None):
+    '''
+    params <-- (dict) from gcm.build_params / prototype.build_params (starting attention weights)
+    counts <-- (2d array) observed response counts [num_inputs x num_categories]
+    c, phi <-- (numeric) starting values
+    r <-- (numeric) distance metric (held fixed)
+    fit_attention = True <-- (bool) also fit the attention weights (otherwise only c & phi)
+    options = None <-- (dict) passed on to scipy.optimize.minimize
+
+    returns dictionary with 'params' (fitted attention), 'c', 'phi', 'nll', 'num_evaluations', 'converged'
+    '''
+    from scipy.optimize import minimize # <-- optional requirement
+
+    cache = distances.build_difference_cache(inputs, references, r)
+
+    def unpack(theta):
+        if fit_attention:
+            attention = np.exp(theta[2:] - np.max(theta[2:]))
+            attention = (attention / np.sum(attention)).reshape(1, -1)
+        else:
+            attention = params['attention_weights']
+        return np.exp(theta[0]), np.exp(theta[1]), {**params, 'attention_weights': attention}
+
+    def objective(theta):
+        c, phi, candidate = unpack(theta)
+        value, gradients = nll_grad(candidate, inputs, references, counts, c, r, phi, cache = cache)
+
+        grad = [gradients['c'] * c, gradients['phi'] * phi] # <-- chain rule for the log scale
+        if fit_attention: # <-- chain rule for the softmax
+            attention = candidate['attention_weights'].reshape(-1)
+            attention_grad = gradients['attention_weights'].reshape(-1)
+            grad += list(attention * (attention_grad - np.dot(attention, attention_grad)))
+
+        return value, np.array(grad)
+
+    theta = [np.log(c), np.log(phi)]
+    if fit_attention:
+        theta += list(np.log(np.maximum(np.reshape(params['attention_weights'], -1), 1e-12)))
+
+    bounds = [(np.log(1e-6), np.log(1e6))] * 2 + [(None, None)] * (len(theta) - 2) # <-- keeps c & phi finite
+
+    result = minimize(objective, np.array(theta), jac = True, method = 'L-BFGS-B', bounds = bounds, options = options)
+    c, phi, fitted = unpack(result.x)
+
+    return {
+        'params': fitted,
+        'c': c,
+        'phi': phi,
+        'nll': result.fun,
+        'num_evaluations': result.nfev,
+        'converged': result.success,
+    }
+
+
+## - - - - - - - - - - - - - - - - - -
+## RUN MODEL
+## - - - - - - - - - - - - - - - - - -
+if __name__ == '__main__':
+    import gcm
+    np.random.seed(0)
+
+    inputs = np.array([
+        [1, 1, 1],
+        [1, 1, 0],
+        [1, 0, 1],
+        [1, 0, 0],
+
+        [0, 0, 0],
+        [0, 0, 1],
+        [0, 1, 0],
+        [0, 1, 1],
+    ])
+
+    exemplars = inputs
+
+    labels = [
+        # 'A','A','A','A', 'B','B','B','B', # <-- type 1
+        # 'A','A','B','B', 'B','B','A','A', # <-- type 2
+        'A','A','A','B', 'B','B','B','A', # <-- type 4
+        # 'B','A','A','B', 'A','B','B','A', # <-- type 6
+    ]
+
+    categories = np.unique(labels)
+    idx_map = {category: idx for category, idx in zip(categories, range(len(categories)))}
+    labels_indexed = [idx_map[label] for label in labels]
+    exemplar_one_hot_targets = np.eye(len(categories))[labels_indexed]
+
+    ## simulate choice counts from known parameters
+    true_params = gcm.build_params(inputs.shape[1], exemplar_one_hot_targets)
+    true_params['attention_weights'] = np.array([[.6, .3, .1]])
+    probabilities = gcm.response(true_params, inputs, exemplars, 3, 1, 2)
+    counts = np.array([np.random.multinomial(5000, p) for p in probabilities])
+
+    ## recover them
+    params = gcm.build_params(inputs.shape[1], exemplar_one_hot_targets)
+    result = fit(params, inputs, exemplars, counts, 1, 1, 1)
+
+    print('c: {:.3f} | phi: {:.3f} | attention: {} | nll: {:.3f} | evaluations: {}'.format(
+        result['c'], result['phi'], result['params']['attention_weights'].round(3), result['nll'], result['num_evaluations']
+    ))
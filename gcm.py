@@ -6,38 +6,35 @@ Generalized Context Model (Nosofsky | from: Formal Approaches in Categorization,
     - forward <-- get model outputs
     - response <-- luce-choice rule (ie, softmax without exponentiation)
     - predict <-- gets class predictions
+    - response_grid <-- response probabilities & log-likelihoods over a grid of (c, r, phi, attention) values
     - build_params <-- returns dictionary of weights
 
+--- Notes ---
+    - forward / response / predict accept an optional exemplar 'index' (distances.build_index) with a
+      'similarity_floor' and/or 'top_k', so only exemplars with exp(-c * d) >= similarity_floor (or the k most
+      similar) are touched; hidden activations then come back as a scipy.sparse matrix
+    - the index is built once by the caller (a floor or top_k without one raises a ValueError instead of rebuilding
+      the tree on every call); an index without a cutoff goes through the tree to every exemplar
 '''
 ## external requirements
 import numpy as np
 
-## minkowski pairwise distance function (https://en.wikipedia.org/wiki/Minkowski_distance)
-def pdist(a1, a2, r, **kwargs):
-    attention_weights = kwargs.get('attention_weights', np.ones([1,a1.shape[1]]) / a1.shape[1])
-
-    # format inputs & exemplars for (i think vectorized) pairwise distance calculations
-    a1_tiled = np.tile(a1, a2.shape[0]).reshape(a1.shape[0], a2.shape[0], a1.shape[1])
-    a2_tiled = np.repeat([a2], a1.shape[0], axis=0)
-
-    distances = np.power(
-        np.sum(
-            np.multiply(
-                attention_weights,
-                np.abs(a1_tiled - a2_tiled) ** r
-            ),
-            axis = 2,
-        ),
-        1/r
-    )
-
-    return distances
-
+## local requirements
+from distances import pdist, build_index, query_index # <-- minkowski pairwise distances (picks a kernel for r) & the exemplar index
+import choice_rules
 
 ## "forward pass"
-def forward(model, inputs, exemplars, c, r):
+def forward(params, inputs, exemplars, c, r, **kwargs):
+    '''
+    index = None <-- (dict) exemplar index from distances.build_index (required by similarity_floor & top_k)
+    similarity_floor = None <-- (numeric) ignore exemplars whose similarity exp(-c * d) falls below this
+    top_k = None <-- (int) only use the k most similar exemplars for each input
+    cache = None <-- (dict) difference cache from distances.build_difference_cache (for fits that only change attention)
+    '''
+    if any(kwargs.get(name, None) is not None for name in ['index', 'similarity_floor', 'top_k']):
+        return forward_indexed(params, inputs, exemplars, c, r, **kwargs)
 
-    distances = pdist(inputs, exemplars, r, attention_weights = params['attention_weights'])
+    distances = pdist(inputs, exemplars, r, attention_weights = params['attention_weights'], cache = kwargs.get('cache', None))
 
     # exemplar layer activations
     hidden_activation = np.exp(
@@ -52,16 +49,85 @@ def forward(model, inputs, exemplars, c, r):
     return [hidden_activation, output_activation]
 
 
-def response(params, inputs, exemplars, c, r, phi): # softmax
-    output_activation = forward(params, inputs, exemplars, c, r)[-1]
-    return np.divide(
-        np.exp(output_activation * phi),
-      #---------#
-        np.sum(
-            np.exp(output_activation * phi), 
-            axis=1, keepdims=True
-        )
+## "forward pass" over the exemplars inside the effective radius only (sub-linear in the number of exemplars)
+def forward_indexed(params, inputs, exemplars, c, r, index = None, similarity_floor = None, top_k = None, **kwargs):
+    from scipy.sparse import csr_matrix # <-- optional requirement
+
+    if index is None:
+        raise ValueError('similarity_floor / top_k need an exemplar index; build it once with distances.build_index(exemplars, r, params[\'attention_weights\']) & pass it as index')
+    if index['r'] != r or not np.array_equal(index['attention_weights'], np.reshape(params['attention_weights'], [1, -1])):
+        raise ValueError('exemplar index was built with a different r or different attention weights; rebuild it')
+
+    # exp(-c * d) >= similarity_floor  <-->  d <= -log(similarity_floor) / c
+    radius = None if similarity_floor is None else -np.log(similarity_floor) / c
+    if radius is None and top_k is None: top_k = index['num_exemplars'] # <-- no cutoff: every exemplar
+
+    rows, cols, distances = query_index(index, inputs, radius = radius, k = top_k)
+
+    # exemplar layer activations (sparse)
+    hidden_activation = csr_matrix(
+        (np.exp((-c) * distances), (rows, cols)),
+        shape = [inputs.shape[0], exemplars.shape[0]]
     )
+    # class predictions (luce-choiced)
+    output_activation = np.asarray(
+        hidden_activation @ params['association_weights']
+    )
+
+    return [hidden_activation, output_activation]
+
+
+def response(params, inputs, exemplars, c, r, phi, **kwargs): # softmax
+    output_activation = forward(params, inputs, exemplars, c, r, **kwargs)[-1]
+    return choice_rules.softmax(output_activation, phi = phi, out = kwargs.get('out', None))
+
+
+## evaluate the luce-choice response over a whole parameter grid (distances computed once per r & attention set)
+def response_grid(params, inputs, exemplars, cs, rs, phis, attention_weights = None, counts = None):
+    '''
+    cs <-- (1d array) specificity values
+    rs <-- (list) distance metrics (keep this small; distances are recomputed for each one)
+    phis <-- (1d array) response mapping values
+    attention_weights = None <-- (2d array) attention sets [num_sets x num_features] (defaults to params['attention_weights'])
+    counts = None <-- (2d array) observed response counts [num_items x num_categories]
+
+    returns dictionary with (grid points in r -> attention -> c -> phi order):
+        'c', 'r', 'phi', 'attention' <-- (1d arrays) [num_grid_points] parameter values (attention is an index into the sets)
+        'probabilities' <-- (3d array) [num_grid_points x num_items x num_categories]
+        'log_likelihood' <-- (1d array) [num_grid_points] sum(counts * log(p)), only if counts are given
+    '''
+    cs = np.asarray(cs, dtype = np.float64).reshape(-1)
+    phis = np.asarray(phis, dtype = np.float64).reshape(-1)
+    if attention_weights is None: attention_weights = params['attention_weights']
+    attention_weights = np.asarray(attention_weights, dtype = np.float64).reshape(-1, inputs.shape[1])
+
+    grid = {'c': [], 'r': [], 'phi': [], 'attention': [], 'probabilities': [], 'log_likelihood': []}
+
+    for r in rs:
+        for a, attention in enumerate(attention_weights):
+            distances = pdist(inputs, exemplars, r, attention_weights = attention.reshape(1, -1))
+
+            # exemplar layer activations [c x items x exemplars] --> class evidence [c x items x categories]
+            output_activation = np.matmul(
+                np.exp(-cs[:, None, None] * distances[None, :, :]),
+                params['association_weights']
+            )
+
+            # log of the exponentiated luce-choice (softmax) for every (c, phi) pair [c x phi x items x categories]
+            log_probabilities = choice_rules.log_softmax(
+                output_activation[:, None, :, :], phi = phis[None, :, None, None], axis = 3
+            ).reshape(cs.size * phis.size, *output_activation.shape[1:])
+
+            grid['c'].append(np.repeat(cs, phis.size))
+            grid['phi'].append(np.tile(phis, cs.size))
+            grid['r'].append(np.full(cs.size * phis.size, r, dtype = np.float64))
+            grid['attention'].append(np.full(cs.size * phis.size, a))
+            grid['probabilities'].append(np.exp(log_probabilities))
+            if counts is not None:
+                grid['log_likelihood'].append(np.sum(counts * log_probabilities, axis = (1, 2)))
+
+    if counts is None: grid.pop('log_likelihood')
+    return {key: np.concatenate(values) for key, values in grid.items()}
 
 
 def build_params(num_features, exemplar_one_hot_targets):
@@ -75,9 +141,9 @@ def build_params(num_features, exemplar_one_hot_targets):
     }
 
 ## predict
-def predict(params, inputs, exemplars, c, r):
+def predict(params, inputs, exemplars, c, r, **kwargs):
     return np.argmax(
-        response(params, inputs, exemplars, c, r, 1),
+        response(params, inputs, exemplars, c, r, 1, **kwargs),
         axis = 1
     )
 
@@ -0,0 +1,114 @@
+'''
+Generalization Surfaces (ALCOVE, GCM & Prototype)
+- - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+--- Functions ---
+    - build_axes <-- grid axis values from a grid spec
+    - grid_points <-- a contiguous run of grid points (flat indices start:stop), generated on demand
+    - generalization_surface <-- response probabilities over the whole grid, chunk by chunk (optionally over a process pool)
+
+--- Notes ---
+    - 'model' is any callable mapping points [num_points x num_features] to probabilities [num_points x num_categories], e.g.
+      functools.partial(gcm.response, params, exemplars = exemplars, c = 2, r = 1, phi = 1)
+    - points are never materialized for the whole grid; only chunk_size points (& their distances) live at once
+    - with a file path as 'out', results go straight into a .npy memmap (np.lib.format.open_memmap), so the surface
+      can be bigger than memory & reloaded with np.load(path, mmap_mode = 'r')
+    - with workers, the model is sent to each worker once (pool initializer), so it must be picklable
+      (functools.partial of a model function is; lambdas are not)
+'''
+## external requirements
+import multiprocessing
+import numpy as np
+
+## local requirements
+import utils
+
+
+## axis values for each dimension; a spec entry is either the values themselves or a (low, high, num_points) tuple
+def build_axes(grid_spec):
+    return [
+        np.linspace(*spec) if isinstance(spec, tuple) else np.asarray(spec, dtype = np.float64)
+        for spec in grid_spec
+    ]
+
+
+## grid points with flat (C order) indices start:stop [stop - start x num_features]
+def grid_points(axes, start, stop):
+    indices = np.unravel_index(np.arange(start, stop), [len(axis) for axis in axes])
+    return np.stack([axis[index] for axis, index in zip(axes, indices)], axis = 1)
+
+
+# model & axes each worker evaluates with (set once by the pool initializer)
+worker_state = {}
+
+
+def init_worker(model, axes):
+    worker_state['model'] = model
+    worker_state['axes'] = axes
+
+
+def evaluate_chunk(bounds):
+    start, stop = bounds
+    return start, stop, worker_state['model'](grid_points(worker_state['axes'], start, stop))
+
+
+## response probabilities at every grid point, shape [*grid_shape x num_categories]
+def generalization_surface(model, grid_spec, chunk_size = 65536, out = None, workers = 0):
+    '''
+    model <-- (callable) points [num_points x num_features] --> probabilities [num_points x num_categories]
+    grid_spec <-- (list) one entry per feature: axis values, or (low, high, num_points)
+    chunk_size = 65536 <-- (int) grid points per model call (bounds memory)
+    out = None <-- (str) .npy path for a memory-mapped result, or (C contiguous array) to fill; a new array otherwise
+    workers = 0 <-- (int) process pool size (0: evaluate in this process)
+
+    returns the filled surface (the memmap, flushed, when out is a path)
+    '''
+    axes = build_axes(grid_spec)
+    grid_shape = tuple(len(axis) for axis in axes)
+    num_points = int(np.prod(grid_shape))
+
+    ## first chunk here, to learn the number of categories (& dtype) for the output
+    first = model(grid_points(axes, 0, min(chunk_size, num_points)))
+    shape = grid_shape + (first.shape[1],)
+
+    out = utils.open_output(out, shape, dtype = first.dtype)
+    if not out.flags.c_contiguous: # <-- otherwise reshape would copy & the results would never reach out
+        raise ValueError('out has to be C contiguous (e.g., np.empty(shape) rather than order = \'F\' or a strided view)')
+
+    flat = out.reshape(num_points, shape[-1]) # <-- a view (out is C contiguous)
+    flat[:first.shape[0]] = first
+
+    chunks = [(start, min(start + chunk_size, num_points)) for start in range(first.shape[0], num_points, chunk_size)]
+
+    if workers == 0:
+        for start, stop in chunks:
+            flat[start:stop] = model(grid_points(axes, start, stop))
+    else:
+        with multiprocessing.Pool(workers, initializer = init_worker, initargs = (model, axes)) as pool:
+            for start, stop, probabilities in pool.imap_unordered(evaluate_chunk, chunks):
+                flat[start:stop] = probabilities
+
+    if isinstance(out, np.memmap): out.flush()
+    return out
+
+
+## - - - - - - - - - - - - - - - - - -
+## RUN MODEL
+## - - - - - - - - - - - - - - - - - -
+if __name__ == '__main__':
+    import functools
+    import gcm
+
+    exemplars = np.array([
+        [.2, .2],
+        [.3, .8],
+        [.8, .3],
+        [.7, .7],
+    ])
+    one_hot_targets = np.eye(2)[[0, 0, 1, 1]]
+
+    params = gcm.build_params(exemplars.shape[1], one_hot_targets)
+    model = functools.partial(gcm.response, params, exemplars = exemplars, c = 4, r = 1, phi = 1)
+
+    surface = generalization_surface(model, [(0, 1, 500), (0, 1, 500)], chunk_size = 50000, workers = 2)
+    print(surface.shape, surface[::100, ::100, 0].round(2))
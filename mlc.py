@@ -8,6 +8,7 @@ MultiLayer Classifier (aka, multilayer perceptron)
     - loss_grad <-- returns gradients
     - response <-- luce-choice rule (ie, softmax without exponentiation)
     - fit <-- trains model on a number of epochs
+    - fit_iter <-- same training as fit, as a generator of learning records
     - predict <-- gets class predictions
     - build_params <-- returns dictionary of weights
     - update_params <-- updates weights
@@ -20,9 +21,10 @@ MultiLayer Classifier (aka, multilayer perceptron)
 ## external requirements
 import numpy as np
 
-def softmax(x):
-    x -= np.max(x)
-    return (np.exp(x).T / np.sum(np.exp(x),axis=1)).T
+## local requirements
+from choice_rules import softmax # <-- row-wise, doesn't modify its input
+import precision
+
 
 ## "forward pass"
 def forward(params, inputs, hps):
@@ -62,8 +64,12 @@ def loss(params, inputs, targets, hps):
 
 
 ## backprop (for sum squared error cost function)
-def loss_grad(params, inputs, targets, hps):
-    hidden_act_raw, hidden_act, output_act_raw, output_act = forward(params, inputs, hps)
+def loss_grad(params, inputs, targets, hps, activations = None):
+    '''
+    activations = None <-- (list) forward(params, inputs, hps) outputs, if they're already computed
+    '''
+    if activations is None: activations = forward(params, inputs, hps)
+    hidden_act_raw, hidden_act, output_act_raw, output_act = activations
 
     ## gradients for decode layer ( chain rule on cost function )
     decode_grad = np.multiply(
@@ -118,6 +124,7 @@ def loss_grad(params, inputs, targets, hps):
 
 ## luce choice
 def response(params, inputs, hps):
+    inputs = precision.cast(inputs)
     return softmax(
         forward(params, inputs, hps)[-1]
     )
@@ -130,7 +137,7 @@ def build_params(num_features, num_hidden_nodes, num_classes, weight_range = [-.
     num_classes <-- number of categories in the dataset
     weight_range = [-.1,.1] <-- (list of numeric)
     '''
-    return {
+    return precision.cast_params({
         'input': {
             'hidden': {
                 'weights': np.random.uniform(*weight_range, [num_features, num_hidden_nodes]),
@@ -143,7 +150,7 @@ def build_params(num_features, num_hidden_nodes, num_classes, weight_range = [-.
                 'bias': np.random.uniform(*weight_range, [1, num_classes]),
             }
         }
-    }
+    })
 
 def build_params_xavier(num_features, num_hidden_nodes, num_classes):
     '''
@@ -152,7 +159,7 @@ def build_params_xavier(num_features, num_hidden_nodes, num_classes):
     num_classes <-- number of categories in the dataset
     weight_range = [-.1,.1] <-- (list of numeric)
     '''
-    return {
+    return precision.cast_params({
         'input': {
             'hidden': {
                 'weights': np.random.normal(0, 1, [num_features, num_hidden_nodes]) * np.sqrt(2 / (num_features + num_hidden_nodes)),
@@ -165,7 +172,7 @@ def build_params_xavier(num_features, num_hidden_nodes, num_classes):
                 'bias': np.zeros([1, num_classes]),
             }
         }
-    }
+    })
 
 ## weight update
 def update_params(params, gradients, lr):
@@ -178,6 +185,7 @@ def update_params(params, gradients, lr):
 
 ## fit to training set
 def fit(params, inputs, targets, hps, learning_rate = .1, training_epochs = 1, randomize_presentation = True):
+    inputs, targets = precision.cast(inputs), precision.cast(targets)
     presentation_order = np.arange(inputs.shape[0])
 
     for e in range(training_epochs):
@@ -193,8 +201,35 @@ def fit(params, inputs, targets, hps, learning_rate = .1, training_epochs = 1, r
 
     return params
 
+## learning trajectory: trains like fit (full batch), yielding a lightweight record per epoch along the way
+def fit_iter(params, inputs, targets, hps, learning_rate = .1, training_epochs = 1, randomize_presentation = True):
+    '''
+    yields dictionaries with 'epoch', 'probabilities' [num_items x num_classes] (response before the update) & 'loss';
+        params are updated in place
+    '''
+    inputs, targets = precision.cast(inputs), precision.cast(targets)
+    presentation_order = np.arange(inputs.shape[0])
+
+    for e in range(training_epochs):
+        if randomize_presentation == True: np.random.shuffle(presentation_order)
+
+        activations = forward(params, inputs, hps)
+        params = update_params(
+            params, 
+            loss_grad(params, inputs, targets, hps, activations = activations), # <-- returns gradients
+            learning_rate,
+        )
+
+        yield {
+            'epoch': e,
+            'probabilities': softmax(activations[-1]),
+            'loss': np.sum(np.square(activations[-1] - targets)) / inputs.shape[0],
+        }
+
+
 ## predict
 def predict(params, inputs, hps):
+    inputs = precision.cast(inputs)
     return np.argmax(
         forward(params, inputs, hps)[-1],
         axis = 1
@@ -26,9 +26,9 @@ MultiLayer Classifier (aka, multilayer perceptron)
 ## external requirements
 import numpy as np
 
-def softmax(x):
-    x -= np.max(x)
-    return (np.exp(x).T / np.sum(np.exp(x),axis=1)).T
+## local requirements
+from choice_rules import softmax # <-- row-wise, doesn't modify its input
+
 
 
 ## "forward pass"
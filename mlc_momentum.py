@@ -8,6 +8,7 @@ MultiLayer Classifier (aka, multilayer perceptron)
     - loss_grad <-- returns gradients
     - response <-- luce-choice rule (ie, softmax without exponentiation)
     - fit <-- trains model on a number of epochs
+    - fit_iter <-- same training as fit, as a generator of learning records
     - predict <-- gets class predictions
     - build_params <-- returns dictionary of weights
     - update_params <-- updates weights
@@ -20,9 +21,10 @@ MultiLayer Classifier (aka, multilayer perceptron)
 ## external requirements
 import numpy as np
 
-def softmax(x):
-    x -= np.max(x)
-    return (np.exp(x).T / np.sum(np.exp(x),axis=1)).T
+## local requirements
+from choice_rules import softmax # <-- row-wise, doesn't modify its input
+import utils
+
 
 ## "forward pass"
 def forward(params, inputs, hps):
@@ -62,8 +64,12 @@ def loss(params, inputs, targets, hps):
 
 
 ## backprop (for sum squared error cost function)
-def loss_grad(params, inputs, targets, hps):
-    hidden_act_raw, hidden_act, output_act_raw, output_act = forward(params, inputs, hps)
+def loss_grad(params, inputs, targets, hps, activations = None):
+    '''
+    activations = None <-- (list) forward(params, inputs, hps) outputs, if they're already computed
+    '''
+    if activations is None: activations = forward(params, inputs, hps)
+    hidden_act_raw, hidden_act, output_act_raw, output_act = activations
 
     ## gradients for decode layer ( chain rule on cost function )
     decode_grad = np.multiply(
@@ -185,24 +191,57 @@ def update_params(params, gradients, velocities, learning_rate, momentum_rate =
 
 
 ## fit to training set
-def fit(params, inputs, targets, hps, training_epochs = 1, randomize_presentation = True):
+def fit(params, inputs, targets, hps, training_epochs = 1, randomize_presentation = True, criterion = None):
+    '''
+    criterion = None <-- (dict) {'accuracy': threshold} or {'loss': threshold}; stops after the first block (epoch) that meets it
+        & returns (params, stopping trial) instead (stopping trial is None if training_epochs ran out first)
+    '''
+    if criterion is not None:
+        correct = np.argmax(targets, axis = 1)
+        stopping_trial = utils.run_to_criterion(
+            fit_iter(params, inputs, targets, hps, training_epochs = training_epochs, randomize_presentation = randomize_presentation),
+            lambda record: correct[record['item']], criterion, inputs.shape[0]
+        )
+        return params, stopping_trial
+
+    for _ in fit_iter(params, inputs, targets, hps, training_epochs = training_epochs, randomize_presentation = randomize_presentation):
+        pass
+
+    return params
+
+## learning trajectory: the training loop behind fit, yielding a lightweight record per trial along the way
+def fit_iter(params, inputs, targets, hps, training_epochs = 1, randomize_presentation = True):
+    '''
+    yields dictionaries with 'epoch', 'trial', 'item', 'probabilities' (response before the update) & 'loss';
+        params are updated in place
+    '''
     presentation_order = np.arange(inputs.shape[0])
     
     velocities = {layer: {connection: {'weights': 0, 'bias': 0} for connection in params[layer]} for layer in params} # <-- initial velocities
+    trial = 0
     for e in range(training_epochs):
         if randomize_presentation == True: np.random.shuffle(presentation_order)
         
-        for i in range(inputs.shape[0]):
+        for i in presentation_order:
+            activations = forward(params, inputs[i:i+1,:], hps)
 
             params, velocities = update_params(
                 params, 
-                loss_grad(params, inputs[i:i+1,:], targets[i:i+1,:], hps), # <-- returns gradients
+                loss_grad(params, inputs[i:i+1,:], targets[i:i+1,:], hps, activations = activations), # <-- returns gradients
                 velocities,
                 hps['learning_rate'],
                 momentum_rate = hps['momentum_rate'],
             )
 
-    return params
+            yield {
+                'epoch': e,
+                'trial': trial,
+                'item': i,
+                'probabilities': softmax(activations[-1])[0],
+                'loss': np.sum(np.square(activations[-1] - targets[i:i+1,:])),
+            }
+            trial += 1
+
 
 ## predict
 def predict(params, inputs):
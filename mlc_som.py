@@ -24,6 +24,9 @@ MultiLayer Classifier (aka, multilayer perceptron)
 ## external requirements
 import numpy as np
 
+## local requirements
+from choice_rules import softmax # <-- row-wise, doesn't modify its input
+
 # dist_func = lambda x: np.exp(- ((x) ** 2))
 
 push_strength = 2
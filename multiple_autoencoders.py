@@ -9,6 +9,8 @@ Multiple Autoencoders
     - response <-- luce-choice rule (ie, softmax without exponentiation)
     - focusing <-- biases impact of diverse dimensions during reconstruction
     - fit <-- trains model on a number of epochs
+    - stack_params <-- every channel's weights stacked along a leading channel axis
+    - unstack_params <-- copies stacked channel weights back into the params dictionary
     - predict <-- gets class predictions
     - build_params <-- returns dictionary of weights
     - update_params <-- updates weights
@@ -16,11 +18,20 @@ Multiple Autoencoders
 
 --- Notes ---
     - implements sum-squared-error cost function
+    - channels never share weights, so each one only depends on the order of its own items; fit(..., mode = 'batched')
+      steps every channel through its t-th item at once (batched matmuls, finished channels masked) & fit(..., mode = 'processes')
+      trains each channel in its own worker process. Both give the same weights as the default online loop
+    - with mode = 'processes' on platforms that spawn (rather than fork) workers, hps has to be picklable (no lambdas)
     - hidden activation function & derivative have to be provided in 'hps' dictionary (there are some available in the utils.py script)
 '''
 ## external requirements
+import multiprocessing
 import numpy as np
 
+## local requirements
+import utils
+import precision
+
 ## "forward pass"
 def forward(params, inputs, channel, hps):
     hidden_act_raw = np.add(
@@ -117,22 +128,34 @@ def loss_grad(params, inputs, channel, hps, targets = None):
 
 
 ## luce choice
-def response(params, inputs, channels, hps, targets = None):
+def response(params, inputs, channels, hps, targets = None, chunk_size = None, out = None):
+    '''
+    chunk_size = None <-- (int) items scored at a time (each chunk is reduced to per-channel error right away); all at once by default
+    out = None <-- (array) [num_channels x num_items] to fill, or (str) .npy path for a memory-mapped result
+
+    note: normalized over every channel & item (1/err / sum(1/err)), so the total is taken after the last chunk
+    '''
     if np.any(targets) == None: targets = inputs
-    activations = np.sum(
-        np.square(
-            np.subtract(
-                targets,
-                np.array([
-                    forward(params, inputs, channel, hps)[-1]
-                    for channel in channels
-                ])
+    inputs, targets = precision.cast(inputs), precision.cast(targets)
+    if chunk_size is None: chunk_size = inputs.shape[0]
+
+    out = utils.open_output(out, [len(channels), inputs.shape[0]], dtype = precision.get_dtype())
+    for start in range(0, inputs.shape[0], chunk_size):
+        chunk = slice(start, start + chunk_size)
+        for c, channel in enumerate(channels):
+            out[c, chunk] = 1 / np.sum(
+                np.square(
+                    np.subtract(
+                        targets[chunk],
+                        forward(params, inputs[chunk], channel, hps)[-1]
+                    )
+                ),
+                axis = 1
             )
-        ),
-        axis = 2
-    )
 
-    return (1 / activations) / np.sum(1 / activations)
+    out /= np.sum(out)
+    if isinstance(out, np.memmap): out.flush()
+    return out
 
 # ## late-stage attention
 # def focus(params, inputs, channels, hps, beta = 0):
@@ -152,7 +175,7 @@ def build_params(num_features, num_hidden_nodes, categories, weight_range = [-.1
     num_categories <-- number of category channels to make
     weight_range = [-.1,.1] <-- (list of numeric)
     '''
-    return {
+    return precision.cast_params({
         'input': {
             **{
                 channel: {
@@ -171,7 +194,7 @@ def build_params(num_features, num_hidden_nodes, categories, weight_range = [-.1
                 for channel in categories
             }
         }
-    }
+    })
 
 def build_params_xavier(num_features, num_hidden_nodes, categories):
     '''
@@ -180,7 +203,7 @@ def build_params_xavier(num_features, num_hidden_nodes, categories):
     num_categories <-- number of category channels to make
     weight_range = [-.1,.1] <-- (list of numeric)
     '''
-    return {
+    return precision.cast_params({
         'input': {
             **{
                 channel: {
@@ -199,7 +222,7 @@ def build_params_xavier(num_features, num_hidden_nodes, categories):
                 for channel in categories
             }
         }
-    }
+    })
 
 ## weight update
 def update_params(params, gradients, lr):
@@ -211,22 +234,121 @@ def update_params(params, gradients, lr):
 
 
 ## fit to training set
-def fit(params, inputs, labels, hps, targets = None, training_epochs = 1, randomize_presentation = True):
+def fit(params, inputs, labels, hps, targets = None, training_epochs = 1, randomize_presentation = True, mode = 'online', workers = None):
+    '''
+    mode = 'online' <-- (str) 'online' (one item at a time), 'batched' (all channels in one step) or 'processes' (a worker per channel)
+    workers = None <-- (int) pool size for mode = 'processes' (None: all cores)
+    '''
     if np.any(targets) == None: targets = inputs
+    inputs, targets = precision.cast(inputs), precision.cast(targets)
     presentation_order = np.arange(inputs.shape[0])
 
+    ## items in the order they're shown, over every epoch
+    trials = []
     for e in range(training_epochs):
         if randomize_presentation == True: np.random.shuffle(presentation_order)
-        
-        for i in range(inputs.shape[0]):
+        trials.append(presentation_order.copy())
+    trials = np.concatenate(trials)
+
+    if mode == 'online':
+        for i in trials:
             gradients = loss_grad(params, inputs[i:i+1,:], labels[i], hps, targets = targets[i:i+1,:])
             params = update_params(params, gradients, hps['learning_rate'])
+        return params
+
+    ## each channel's own items, in the order they're shown
+    channels = list(params['input'])
+    sequences = [[i for i in trials if labels[i] == channel] for channel in channels]
+
+    if mode == 'batched':
+        return fit_batched(params, inputs, targets, hps, channels, sequences)
+
+    if mode == 'processes':
+        tasks = [
+            (channel, {'input': {channel: params['input'][channel]}, 'hidden': {channel: params['hidden'][channel]}}, inputs[sequence], targets[sequence])
+            for channel, sequence in zip(channels, sequences)
+        ]
+        with multiprocessing.Pool(workers, initializer = init_channel_worker, initargs = (hps,)) as pool:
+            for channel, channel_params in pool.imap_unordered(fit_channel, tasks):
+                params['input'][channel] = channel_params['input'][channel]
+                params['hidden'][channel] = channel_params['hidden'][channel]
+        return params
+
+    raise ValueError('unknown mode: ' + str(mode))
+
+
+## every channel steps through its own t-th item at once; channels that ran out of items are masked
+def fit_batched(params, inputs, targets, hps, channels, sequences):
+    stacked = stack_params(params, channels)
+    input_weights, input_bias = stacked['input']['weights'], stacked['input']['bias']
+    hidden_weights, hidden_bias = stacked['hidden']['weights'], stacked['hidden']['bias']
+
+    num_steps = max(len(sequence) for sequence in sequences)
+    items = np.zeros([len(channels), num_steps], dtype = int)
+    learning_rates = np.zeros([len(channels), num_steps, 1, 1]) # <-- 0 where a channel has no item
+    for c, sequence in enumerate(sequences):
+        items[c, :len(sequence)] = sequence
+        learning_rates[c, :len(sequence)] = hps['learning_rate']
+
+    for t in range(num_steps):
+        x, y, lr = inputs[items[:, t]][:, None, :], targets[items[:, t]][:, None, :], learning_rates[:, t] # <-- [num_channels x 1 x num_features]
+
+        hidden_act_raw = np.matmul(x, input_weights) + input_bias
+        hidden_act = hps['hidden_activation'](hidden_act_raw)
+        output_act_raw = np.matmul(hidden_act, hidden_weights) + hidden_bias
+        output_act = hps['output_activation'](output_act_raw)
+
+        decode_grad = hps['output_activation_deriv'](output_act_raw) * (2 * (output_act - y))
+        encode_grad = hps['hidden_activation_deriv'](hidden_act_raw) * np.matmul(decode_grad, hidden_weights.transpose(0, 2, 1))
+
+        hidden_weights -= lr * np.matmul(hidden_act.transpose(0, 2, 1), decode_grad)
+        hidden_bias -= lr * decode_grad
+        input_weights -= lr * np.matmul(x.transpose(0, 2, 1), encode_grad)
+        input_bias -= lr * encode_grad
+
+    return unstack_params(stacked, params, channels)
+
+
+# hps for the channel workers (set once by the pool initializer, so it isn't sent with every task)
+worker_hps = {}
+
+
+def init_channel_worker(hps):
+    worker_hps.update(hps)
+
+
+## online training of one channel on its own items (in order)
+def fit_channel(task):
+    channel, params, inputs, targets = task
+    for i in range(inputs.shape[0]):
+        gradients = loss_grad(params, inputs[i:i+1,:], channel, worker_hps, targets = targets[i:i+1,:])
+        params = update_params(params, gradients, worker_hps['learning_rate'])
+    return channel, params
+
+
+## channel weights stacked as 'input' [num_channels x num_features x num_hidden] & 'hidden' [num_channels x num_hidden x num_features] (& biases)
+def stack_params(params, channels):
+    return {
+        layer: {
+            'weights': np.stack([params[layer][channel]['weights'] for channel in channels]).astype(precision.get_dtype()),
+            'bias': np.stack([params[layer][channel]['bias'] for channel in channels]).astype(precision.get_dtype()),
+        }
+        for layer in ['input', 'hidden']
+    }
+
 
+## stacked channel weights back into params (in place)
+def unstack_params(stacked, params, channels):
+    for layer in ['input', 'hidden']:
+        for c, channel in enumerate(channels):
+            params[layer][channel]['weights'][...] = stacked[layer]['weights'][c]
+            params[layer][channel]['bias'][...] = stacked[layer]['bias'][c]
     return params
 
 ## predict
 def predict(params, inputs, categories, hps, targets = None):
     if np.any(targets) == None: targets = inputs
+    inputs, targets = precision.cast(inputs), precision.cast(targets)
     return np.argmin(
         response(params, inputs, categories, hps, targets = targets),
         axis = 0
@@ -16,12 +16,17 @@ Multitasker:
 
 --- Notes ---
     - implements sum-squared-error cost function
+    - fit(..., backend = 'numba') runs each trial through a compiled kernel (optional numba requirement, see backends.py)
     - hidden activation function & derivative have to be provided in 'hps' dictionary (there are some examples available in the utils.py script)
 '''
 
 ## external requirements
 import numpy as np
 
+## local requirements
+import backends
+import precision
+
 
 ## "forward pass"
 def forward(params, inputs, hps):
@@ -138,7 +143,7 @@ def build_params(num_features, num_hidden_nodes, num_categories, weight_range =
     num_hidden_nodes <-- (numeric)
     weight_range = [-.1,.1] <-- (list of numeric)
     '''
-    return {
+    return precision.cast_params({
         'input': {
             'hidden': {
                 'weights': np.random.uniform(*weight_range, [num_features, num_hidden_nodes]),
@@ -151,7 +156,7 @@ def build_params(num_features, num_hidden_nodes, num_categories, weight_range =
                 'bias': np.random.uniform(*weight_range, [1, num_features+num_categories]),
             }
         }
-    }
+    })
 
 def build_params_xavier(num_features, num_hidden_nodes, num_categories):
     '''
@@ -159,7 +164,7 @@ def build_params_xavier(num_features, num_hidden_nodes, num_categories):
     num_hidden_nodes <-- (numeric)
     weight_range = [-.1,.1] <-- (list of numeric)
     '''
-    return {
+    return precision.cast_params({
         'input': {
             'hidden': {
                 'weights': np.random.normal(0, 1, [num_features, num_hidden_nodes]) * np.sqrt(2 / (num_features + num_hidden_nodes)),
@@ -172,7 +177,7 @@ def build_params_xavier(num_features, num_hidden_nodes, num_categories):
                 'bias': np.zeros([1, num_features+num_categories]),
             }
         }
-    }
+    })
 
 ## weight update
 def update_params(params, gradients, lr):
@@ -184,15 +189,29 @@ def update_params(params, gradients, lr):
 
 
 ## fit to training set
-def fit(params, inputs, hps, targets = None, training_epochs = 1, randomize_presentation = True):
+def fit(params, inputs, hps, targets = None, training_epochs = 1, randomize_presentation = True, backend = 'numpy'):
+    '''
+    backend = 'numpy' <-- (str) 'numba' (or 'auto') runs each trial as one compiled kernel (see backends.py)
+    '''
     if np.any(targets) == None: targets = inputs
+    inputs, targets = precision.cast(inputs), precision.cast(targets)
     presentation_order = np.arange(inputs.shape[0])
 
+    activations = backends.network_activations(hps, backend)
+
     for e in range(training_epochs):
         if randomize_presentation == True: np.random.shuffle(presentation_order)
         
         for i in range(inputs.shape[0]):
 
+            if activations is not None:
+                backends.network_trial(
+                    params['input']['hidden']['weights'], params['input']['hidden']['bias'],
+                    params['hidden']['output']['weights'], params['hidden']['output']['bias'],
+                    inputs[i:i+1,:], targets[i:i+1,:], hps['learning_rate'], *activations
+                )
+                continue
+
             params = update_params(
                 params, 
                 loss_grad(params, inputs[i:i+1,:], hps, targets = targets[i:i+1,:]), # <-- returns gradients
@@ -6,39 +6,29 @@ Prototype Model (Medin & Smith | from: Formal Approaches in Categorization, Poth
     - forward <-- get model outputs
     - response <-- softmax function
     - predict <-- gets class predictions
+    - fit <-- computes prototypes (category means) from a training set
+    - partial_fit <-- folds new items into the running category sums & counts (O(num_features) per item)
+    - stream <-- trial-by-trial predictions on a stream of items, updating prototypes after each one
     - build_params <-- returns dictionary of weights
 
+--- Notes ---
+    - prototypes are kept in params['prototypes'] (with running 'prototype_sums' & 'prototype_counts'),
+      so pass params['prototypes'] as the 'prototypes' argument after fitting
 '''
 ## external requirements
 import numpy as np
 
-
-## minkowski pairwise distance function (https://en.wikipedia.org/wiki/Minkowski_distance)
-def pdist(a1, a2, r, **kwargs):
-    attention_weights = kwargs.get('attention_weights', np.ones([1,a1.shape[1]]) / a1.shape[1])
-
-    # format inputs & prototypes for (i think vectorized) pairwise distance calculations
-    a1_tiled = np.tile(a1, a2.shape[0]).reshape(a1.shape[0], a2.shape[0], a1.shape[1])
-    a2_tiled = np.repeat([a2], a1.shape[0], axis=0)
-
-    distances = np.power(
-        np.sum(
-            np.multiply(
-                attention_weights,
-                np.abs(a1_tiled - a2_tiled) ** r
-            ),
-            axis = 2,
-        ),
-        1/r
-    )
-
-    return distances
+## local requirements
+from distances import pdist # <-- minkowski pairwise distances (picks a kernel for r)
+import choice_rules
 
 
 ## "forward pass"
-def forward(model, inputs, prototypes, c, r):
-
-    distances = pdist(inputs, prototypes, r, attention_weights = params['attention_weights'])
+def forward(params, inputs, prototypes, c, r, **kwargs):
+    '''
+    cache = None <-- (dict) difference cache from distances.build_difference_cache (for fits that only change attention)
+    '''
+    distances = pdist(inputs, prototypes, r, attention_weights = params['attention_weights'], cache = kwargs.get('cache', None))
 
     # prototype layer activations
     hidden_activation = np.exp(
@@ -53,16 +43,9 @@ def forward(model, inputs, prototypes, c, r):
     return [hidden_activation, output_activation]
 
 
-def response(params, inputs, prototypes, c, r, phi): # softmax
-    output_activation = forward(params, inputs, prototypes, c, r)[-1]
-    return np.divide(
-        np.exp(output_activation * phi),
-      #---------#
-        np.sum(
-            np.exp(output_activation * phi), 
-            axis=1, keepdims=True
-        )
-    )
+def response(params, inputs, prototypes, c, r, phi, **kwargs): # softmax
+    output_activation = forward(params, inputs, prototypes, c, r, **kwargs)[-1]
+    return choice_rules.softmax(output_activation, phi = phi, out = kwargs.get('out', None))
 
 
 def build_params(num_features, prototype_one_hot_targets):
@@ -73,12 +56,62 @@ def build_params(num_features, prototype_one_hot_targets):
     return {
         'attention_weights': np.ones([1, num_features]) / num_features, # <-- input -to- hidden 
         'association_weights': prototype_one_hot_targets, # <-- hidden -to- output
+        'prototypes': np.zeros([prototype_one_hot_targets.shape[0], num_features]), # <-- running category means
+        'prototype_sums': np.zeros([prototype_one_hot_targets.shape[0], num_features]),
+        'prototype_counts': np.zeros(prototype_one_hot_targets.shape[0]),
     }
 
+
+## fold new items into the running sums & counts; only the touched prototypes are recomputed
+def partial_fit(params, inputs, labels):
+    '''
+    inputs <-- (2d array) [num_items x num_features]
+    labels <-- (1d array) prototype (category) index of each item
+    '''
+    labels = np.asarray(labels, dtype = int).reshape(-1)
+
+    np.add.at(params['prototype_sums'], labels, inputs)
+    params['prototype_counts'] += np.bincount(labels, minlength = params['prototype_counts'].shape[0])
+
+    touched = np.unique(labels)
+    params['prototypes'][touched] = params['prototype_sums'][touched] / params['prototype_counts'][touched, None]
+    return params
+
+
+## prototypes from scratch (category means of the training set)
+def fit(params, inputs, labels):
+    params['prototype_sums'][...] = 0
+    params['prototype_counts'][...] = 0
+    params['prototypes'][...] = 0
+    return partial_fit(params, inputs, labels)
+
+
+## trial-by-trial: yields the response to each item before it is learned
+def stream(params, inputs, labels, c, r, phi):
+    '''
+    inputs, labels <-- (iterables) items [num_features] & their prototype indices; can be live (e.g., generators)
+
+    yields response probabilities [1 x num_categories]; prototypes without any items yet are left out of the response
+    '''
+    for item, label in zip(inputs, labels):
+        item = np.reshape(item, [1, -1])
+        seen = params['prototype_counts'] > 0
+
+        if np.any(seen):
+            yield response(
+                {**params, 'association_weights': params['association_weights'][seen]},
+                item, params['prototypes'][seen], c, r, phi
+            )
+        else:
+            yield np.ones([1, params['association_weights'].shape[1]]) / params['association_weights'].shape[1]
+
+        params = partial_fit(params, item, [label])
+
+
 ## predict
-def predict(params, inputs, prototypes, c, r):
+def predict(params, inputs, prototypes, c, r, **kwargs):
     return np.argmax(
-        response(params, inputs, prototypes, c, r, 1),
+        response(params, inputs, prototypes, c, r, 1, **kwargs),
         axis = 1
     )
 
@@ -116,11 +149,6 @@ if __name__ == '__main__':
     prototype_labels_indexed = [idx_map[label] for label in categories]
     prototype_one_hot_targets = np.eye(len(categories))[prototype_labels_indexed]
 
-    prototypes = np.array([
-        np.mean(inputs[labels_indexed == idx_map[label],:], axis = 0)
-        for label in categories
-    ])
-
     hps = {
         'c': 2, # <-- specificity
         'r': 1, # <-- distance metric (1: cityblock, 2: euclidean)
@@ -132,5 +160,7 @@ if __name__ == '__main__':
         prototype_one_hot_targets, # <-- association_strengths
     )
 
-    p = predict(params, inputs, prototypes, hps['c'], hps['r'])
+    params = fit(params, inputs, labels_indexed)
+
+    p = predict(params, inputs, params['prototypes'], hps['c'], hps['r'])
     print(p)
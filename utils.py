@@ -1,3 +1,5 @@
+import json
+import hashlib
 import numpy as np
 
 ## - - - - - - - - - - - - - - - - - - - - - - -
@@ -22,4 +24,59 @@ def organize_data_from_txt(data_filepath, delimiter = ','):
     # generate one hot targets
     data['one_hot_targets'] = np.eye(len(data['categories']))[data['labels_indexed']]
 
-    return data
\ No newline at end of file
+    return data
+
+
+## cheap content key for an array (shape, dtype & a hash of the raw bytes) used to invalidate caches
+def fingerprint(a):
+    a = np.ascontiguousarray(a)
+    return (a.shape, a.dtype.str, hashlib.blake2b(a.view(np.uint8), digest_size = 16).digest())
+
+
+## output for chunked results: a new array, the caller's array (shape checked) or, for a file path, a .npy memmap
+def open_output(out, shape, dtype = np.float64):
+    shape = tuple(shape)
+    if out is None:
+        return np.empty(shape, dtype = dtype)
+    if isinstance(out, str):
+        return np.lib.format.open_memmap(out, mode = 'w+', dtype = dtype, shape = shape)
+    if out.shape != shape:
+        raise ValueError('out has shape {}, results need {}'.format(out.shape, tuple(shape)))
+    return out
+
+
+## streams learning records (e.g., from a model's fit_iter) to a json-lines file, one record per line
+def save_records(records, filepath):
+    with open(filepath, 'w') as f:
+        for record in records:
+            f.write(json.dumps({
+                key: value.tolist() if hasattr(value, 'tolist') else value
+                for key, value in record.items()
+            }) + '\n')
+
+
+## consumes a model's per-trial fit_iter records until a block meets the criterion
+def run_to_criterion(records, correct, criterion, block_size):
+    '''
+    records <-- (generator) per-trial records ('probabilities' & 'loss') from a model's fit_iter
+    correct <-- (callable) record --> index of the correct response
+    criterion <-- (dict) {'accuracy': threshold} (proportion correct, argmax of the probabilities) or {'loss': threshold} (mean loss)
+    block_size <-- (int) trials per block
+
+    returns the number of trials run when the first block met the criterion (None if training ended first)
+    '''
+    (measure, threshold), = criterion.items()
+    if measure not in ['accuracy', 'loss']: raise ValueError('unknown criterion: ' + str(measure))
+
+    num_correct, total_loss = 0, 0
+    for trial, record in enumerate(records, 1):
+        num_correct += np.argmax(record['probabilities']) == correct(record)
+        total_loss += record['loss']
+
+        if trial % block_size == 0:
+            if (measure == 'accuracy' and num_correct / block_size >= threshold) or (measure == 'loss' and total_loss / block_size <= threshold):
+                records.close()
+                return trial
+            num_correct, total_loss = 0, 0
+
+    return None